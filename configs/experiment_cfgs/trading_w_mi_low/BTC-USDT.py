@@ -26,6 +26,21 @@ look_back_days = long_term_past_date_range
 previous_action_look_back_days = 7
 top_k = 5
 
+# token budgets of the market intelligence prompt sections
+latest_market_intelligence_token_budget = 6000
+past_market_intelligence_token_budget = 6000
+past_market_intelligence_item_max_tokens = 512
+article_max_tokens = 512
+
+# number of prompt stages of a step that may run at the same time
+stage_workers = 4
+# prepare the next day's chart and prompt inputs while the current day waits on the LLM
+prefetch_next_step = False
+# render the kline charts of the whole run on the plots render pool before the first step
+prerender_klines = False
+# draw the price and return chart of the run so far at every step
+plot_trading_chart = False
+
 train_latest_market_intelligence_summary_template_path = "res/prompts/templates/train/train-mi-w-low-w-decision/latest_market_intelligence_summary.yaml"
 train_past_market_intelligence_summary_template_path = "res/prompts/templates/train/train-mi-w-low-w-decision/past_market_intelligence_summary.yaml"
 train_low_level_reflection_template_path = "res/prompts/templates/train/train-mi-w-low-w-decision/low_level_reflection.yaml"
@@ -44,7 +59,20 @@ dataset = dict(
     interval="1d",
     assets_path="configs/_asset_lists_/exp_cryptos.txt",
     workdir=workdir,
-    tag=tag
+    tag=tag,
+    indicators=dict(
+        sma_length=5,
+        bbands_length=5,
+        bbands_std=2.0,
+        return_periods=[
+            short_term_past_date_range,
+            medium_term_past_date_range,
+            long_term_past_date_range,
+            short_term_next_date_range,
+            medium_term_next_date_range,
+            long_term_next_date_range,
+        ]
+    )
 )
 
 train_environment = dict(
@@ -82,6 +110,14 @@ plots = dict(
     root = root,
     workdir = workdir,
     tag = tag,
+    suffix = "png", # "jpeg" gives smaller images for the vision prompt
+    dpi = 300,
+    figsize = (12, 8),
+    save_images = True, # keep a copy of every chart sent to the model on disk
+    async_save = True,
+    render_workers = 2, # threads rendering kline charts ahead of the steps that use them
+    prerender_window = 8, # days of kline charts prerender_klines keeps rendered or queued ahead of the run
+    cache_size_mb = 256, # reuse charts of identical windows across runs, least recently used evicted beyond this
 )
 
 memory = dict(
@@ -97,7 +133,10 @@ memory = dict(
 
 latest_market_intelligence_summary = dict(
     type="LatestMarketIntelligenceSummaryPrompt",
-    model = "gpt-4o"
+    model = "gpt-4o",
+    news_token_budget=latest_market_intelligence_token_budget,
+    article_max_tokens=article_max_tokens,
+    max_news_items=20,
 )
 
 past_market_intelligence_summary = dict(
@@ -127,3 +166,7 @@ provider = dict(
     type="OpenAIProvider",
     provider_cfg_path="configs/provider_configs/openai_config.json",
 )
+
+# Optional separate provider for memory embeddings, e.g. local CPU embeddings instead of the remote API:
+# embedding_provider = dict(type="LocalEmbeddingProvider", model_name="all-MiniLM-L6-v2", batch_size=64, num_threads=4)
+embedding_provider = None
@@ -1 +1,2 @@
-from .dataset import Dataset
\ No newline at end of file
+from .dataset import Dataset
+from .indicators import IndicatorEngine
\ No newline at end of file
@@ -10,6 +10,7 @@ pd.set_option('display.max_columns', 100000)
 pd.set_option('display.max_rows', 100)
 
 from src.registry import DATASET
+from src.data.indicators import IndicatorEngine
 
 @DATASET.register_module(force=True)
 class Dataset:
@@ -21,6 +22,7 @@ class Dataset:
                  interval: str = "1d",
                  workdir: str = None,
                  tag: str = None,
+                 indicators: dict = None,
                  ):
         self.root = root
         self.price_path = os.path.join(root, price_path)
@@ -29,6 +31,7 @@ class Dataset:
         self.interval = interval
         self.workdir = workdir
         self.tag = tag
+        self.indicator_cfg = indicators if indicators is not None else dict()
 
         self.exp_path = os.path.join(self.root, self.workdir, self.tag)
         os.makedirs(self.exp_path, exist_ok=True)
@@ -37,6 +40,7 @@ class Dataset:
         self.prices = self._load_prices()
         print(type(self.prices))
         self.news = self._load_news()
+        self.indicators = self._init_indicators()
         
     def _init_assets(self):
         with open(self.assets_path) as op:
@@ -64,6 +68,16 @@ class Dataset:
             
         return prices
 
+    def _init_indicators(self):
+        
+        # Indicators are computed once over the full history and shared by charts and prompts
+        indicators = {}
+
+        for asset, df in self.prices.items():
+            indicators[asset] = IndicatorEngine(df, **self.indicator_cfg)
+
+        return indicators
+
     def _load_news(self):
 
         news = {}
@@ -82,18 +96,21 @@ class Dataset:
             df = pd.read_csv(path)
 
             df["timestamp"] = pd.to_datetime(df["timestamp"])
-            df["timestamp"] = df["timestamp"].apply(lambda x: x.strftime("%Y-%m-%d"))
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
-
             df = df.dropna(axis=0, how="any")
-            df = df.sort_values(by="timestamp")
+
+            # Keep the full publish time so same-day articles can still be ranked by recency
+            df["published_at"] = df["timestamp"]
+            df = df.sort_values(by="published_at", kind="stable")
             df = df.reset_index(drop=True)
 
+            df["timestamp"] = df["timestamp"].apply(lambda x: x.strftime("%Y-%m-%d"))
+            df["timestamp"] = pd.to_datetime(df["timestamp"])
+
             df["id"] = df.index + global_id
             df["id"] = df["id"].apply(lambda x: "{:06d}".format(x))
             global_id += len(df)
 
-            df = df[["timestamp", "id", "title", "text"]]
+            df = df[["timestamp", "published_at", "id", "title", "text"]]
 
             news[asset] = df
 
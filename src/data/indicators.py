@@ -0,0 +1,113 @@
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+
+class IndicatorEngine:
+    '''Technical indicators of one asset, computed once over its full price history.
+
+    Holds the 5-day SMA, Bollinger Bands and past/forward returns for every bar, indexed
+    by timestamp. Charts and prompts read windows of it instead of recomputing the
+    indicators over every state window. New bars are added with `extend`, which only
+    recomputes the tail that the new bars can affect.
+
+    Columns:
+        sma: simple moving average of the close.
+        bbl, bbm, bbu, bbb, bbp: lower, middle and upper band, bandwidth and percent of the Bollinger Bands.
+        ret_<n>: change of the close over the past n bars, close[t] / close[t - n] - 1.
+        fwd_ret_<n>: change of the close over the next n bars, close[t + n] / close[t] - 1.
+    '''
+
+    def __init__(self,
+                 prices: pd.DataFrame,
+                 sma_length: int = 5,
+                 bbands_length: int = 5,
+                 bbands_std: float = 2.0,
+                 return_periods: List[int] = (1, 7, 14)) -> None:
+        '''
+        :param prices: OHLCV bars with a "timestamp" column or a timestamp index.
+        :param sma_length: Length of the simple moving average.
+        :param bbands_length: Length of the Bollinger Bands.
+        :param bbands_std: Number of standard deviations of the Bollinger Bands.
+        :param return_periods: Periods of the past and forward returns.
+        '''
+        self.sma_length = sma_length
+        self.bbands_length = bbands_length
+        self.bbands_std = bbands_std
+        self.return_periods = sorted(set(int(period) for period in return_periods))
+
+        # Bars a value depends on, before or after it
+        self.context = max([self.sma_length, self.bbands_length] + self.return_periods)
+
+        self.close = self._clean(prices)
+        self.frame = self._compute(self.close)
+
+    @staticmethod
+    def _clean(prices: pd.DataFrame) -> pd.Series:
+        if "timestamp" in prices.columns:
+            prices = prices.set_index("timestamp")
+        close = prices["close"].dropna()
+        close = close[~close.index.duplicated(keep="first")]
+        return close.sort_index()
+
+    def _compute(self, close: pd.Series) -> pd.DataFrame:
+        frame = pd.DataFrame(index=close.index)
+        frame["sma"] = ta.sma(close, length=self.sma_length)
+
+        bbands = ta.bbands(close, length=self.bbands_length, std=self.bbands_std)
+        if bbands is None:
+            # Fewer bars than the band length
+            bbands = pd.DataFrame(np.nan, index=close.index, columns=range(5))
+        frame["bbl"] = bbands.iloc[:, 0]
+        frame["bbm"] = bbands.iloc[:, 1]
+        frame["bbu"] = bbands.iloc[:, 2]
+        frame["bbb"] = bbands.iloc[:, 3]
+        frame["bbp"] = bbands.iloc[:, 4]
+
+        for period in self.return_periods:
+            frame[f"ret_{period}"] = close.pct_change(periods=period)
+            frame[f"fwd_ret_{period}"] = close.pct_change(periods=period).shift(-period)
+        return frame
+
+    def extend(self, prices: pd.DataFrame) -> None:
+        '''
+        Adds new bars and updates the indicators they affect.
+
+        :param prices: OHLCV bars, bars at or before the last known timestamp are ignored.
+        '''
+        close = self._clean(prices)
+        if len(self.close) > 0:
+            close = close[close.index > self.close.index[-1]]
+        if len(close) == 0:
+            return
+
+        num_old = len(self.close)
+        self.close = pd.concat([self.close, close])
+
+        # Past-looking values of the new bars and forward returns of the last old bars change;
+        # both need `context` bars before them to be recomputed
+        start = max(num_old - 2 * self.context, 0)
+        tail = self._compute(self.close.iloc[start:])
+        keep = max(num_old - self.context, 0)
+        self.frame = pd.concat([self.frame.iloc[:keep], tail.iloc[keep - start:]])
+
+    def window(self, start, end) -> pd.DataFrame:
+        '''
+        Indicators of the bars between start and end, both inclusive, as a slice of the precomputed frame.
+
+        :param start: First timestamp of the window.
+        :param end: Last timestamp of the window.
+        :return: Indicator rows of the window.
+        '''
+        index = self.frame.index
+        i = index.searchsorted(pd.Timestamp(start), side="left")
+        j = index.searchsorted(pd.Timestamp(end), side="right")
+        return self.frame.iloc[i:j]
+
+    def at(self, date) -> Optional[pd.Series]:
+        '''Indicators of a single bar, or None if there is no bar at that date.'''
+        date = pd.Timestamp(date)
+        if date not in self.frame.index:
+            return None
+        return self.frame.loc[date]
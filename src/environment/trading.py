@@ -100,6 +100,7 @@ class TradingEnvironment(gym.Env):
         self.news = self.dataset.news[selected_asset]
         self.prices = self.prices.reset_index(drop=True)
         self.news = self.news.reset_index(drop=True)
+        self.indicators = getattr(self.dataset, "indicators", {}).get(selected_asset)
         
         # Calendar Date Parameters
         self.start_date = start_date
@@ -142,18 +143,22 @@ class TradingEnvironment(gym.Env):
             "BUY": 1,
         }
         
-    def get_current_date(self):
+    def get_current_date(self, day=None):
         '''
         Retrieves the current date based on the agent's position in the dataset.
 
         Parameters:
-            None
+            day (int, optional):
+                Day index to look up instead of the current day, e.g. to prepare an upcoming step.
+                Defaults to None.
 
         Returns:
             datetime:
                 The timestamp corresponding to the current day in the trading simulation.
         '''
-        return self.prices.index[self.day]
+        if day is None:
+            day = self.day
+        return self.prices.index[day]
     
     def get_current_price(self):
         '''
@@ -182,14 +187,17 @@ class TradingEnvironment(gym.Env):
         '''
         return self.cash + self.position * price
     
-    def get_state(self):
+    def get_state(self, day=None):
         '''
         Constructs the current state representation for the agent.
 
         The state includes historical and, optionally, future data within specified look-back and look-forward windows.
+        The state of a day only depends on the day index, so upcoming states can be built ahead of time.
 
         Parameters:
-            None
+            day (int, optional):
+                Day index to build the state for instead of the current day.
+                Defaults to None.
 
         Returns:
             dict:
@@ -198,11 +206,16 @@ class TradingEnvironment(gym.Env):
                         Historical and future price data within the defined window.
                     - "news" (pd.DataFrame):
                         Historical and future news data within the defined window.
+                    - "indicators" (pd.DataFrame):
+                        Precomputed technical indicators within the defined window, if the dataset provides them.
         '''
+        if day is None:
+            day = self.day
+
         state = {}
 
-        days_ago = self.prices.index[max(self.day - self.look_back_days, 0)]
-        days_future = self.prices.index[min(self.day + self.look_forward_days, len(self.prices) - 1)]
+        days_ago = self.prices.index[max(day - self.look_back_days, 0)]
+        days_future = self.prices.index[min(day + self.look_forward_days, len(self.prices) - 1)]
 
         price = self.prices[self.prices.index <= days_future]
         price = price[price.index >= days_ago]
@@ -211,6 +224,8 @@ class TradingEnvironment(gym.Env):
 
         state["price"] = price
         state["news"] = news
+        if self.indicators is not None:
+            state["indicators"] = self.indicators.window(days_ago, days_future)
         
         return state
     
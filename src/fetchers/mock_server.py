@@ -0,0 +1,286 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+TIMEFRAME_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def parse_timeframe(timeframe: str) -> int:
+    """
+    Length of a ccxt-style timeframe such as '15m', '1h' or '1d' in seconds.
+    """
+    return int(timeframe[:-1]) * TIMEFRAME_SECONDS[timeframe[-1]]
+
+def _uniform(*key) -> float:
+    """
+    Deterministic pseudo-random number in [0, 1) for a key, so every candle and article is reproducible.
+    """
+    digest = hashlib.blake2b(":".join(str(k) for k in key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+class MockMarketServer:
+    """
+    Local stand-in for the exchange and news APIs the fetchers download from.
+
+    Serves synthetic OHLCV candles and FMP-style paginated crypto news over HTTP, so the
+    fetchers' concurrency, retry and rate-limit behaviour can be benchmarked offline. All
+    data is a deterministic function of the symbol and time, so runs are reproducible and
+    incremental downloads line up with full ones. Responses can be slowed down, rate
+    limited and made to fail at random.
+
+    Endpoints:
+        GET /api/v1/ohlcv?symbol=&timeframe=&since=&limit=
+            Candles as [[timestamp_ms, open, high, low, close, volume], ...], oldest first.
+        GET /api/v4/crypto_news?symbol=&page=&from=&to=&apikey=
+            Articles with publishedDate, title, image, site, text and url, newest first.
+        GET /stats
+            Request counters of the server.
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 8765,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 rate_limit_requests: int = None,
+                 rate_limit_window: float = 60.0,
+                 error_rate: float = 0.0,
+                 seed: int = 0,
+                 now: str = None,
+                 news_start_date: str = "2023-01-01",
+                 news_per_day: int = 24,
+                 page_size: int = 20,
+                 max_candles: int = 300):
+        """
+        Parameters:
+            host (str): Interface to listen on.
+            port (int): Port to listen on, 0 picks a free port.
+            latency (float): Seconds every response is delayed by.
+            jitter (float): Additional random delay of up to this many seconds.
+            rate_limit_requests (int): Requests allowed per rate_limit_window, more are answered with 429. None disables the limit.
+            rate_limit_window (float): Length of the rate limit window in seconds.
+            error_rate (float): Probability that a request fails with a 500.
+            seed (int): Seed of the latency jitter and error injection.
+            now (str): Fixed current time (YYYY-MM-DD), no candle or article after it exists. Defaults to the real time.
+            news_start_date (str): Date of the oldest article of every symbol.
+            news_per_day (int): Number of articles per symbol and day.
+            page_size (int): Number of articles per news page.
+            max_candles (int): Maximum number of candles per OHLCV response.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_requests = rate_limit_requests
+        self.rate_limit_window = rate_limit_window
+        self.error_rate = error_rate
+        self.now = self._parse_date(now) if now is not None else None
+        self.news_start = self._parse_date(news_start_date)
+        self.news_interval = 86400 / news_per_day
+        self.page_size = page_size
+        self.max_candles = max_candles
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent_requests = deque()
+        self.stats = {"requests": 0, "ohlcv": 0, "news": 0, "rate_limited": 0, "errors": 0}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @staticmethod
+    def _parse_date(date_str: str) -> float:
+        return datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def current_time(self) -> float:
+        return self.now if self.now is not None else time.time()
+
+    def start(self) -> "MockMarketServer":
+        """
+        Serve in a background thread.
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _admit(self):
+        """
+        Count a request and decide how to answer it.
+
+        Returns:
+            tuple: HTTP status to fail with (or None to serve the request) and the delay in seconds.
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+            delay = self.latency + self.jitter * self.random.random()
+
+            if self.rate_limit_requests is not None:
+                now = time.monotonic()
+                while self.recent_requests and self.recent_requests[0] <= now - self.rate_limit_window:
+                    self.recent_requests.popleft()
+                if len(self.recent_requests) >= self.rate_limit_requests:
+                    self.stats["rate_limited"] += 1
+                    return 429, delay
+                self.recent_requests.append(now)
+
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500, delay
+        return None, delay
+
+    def ohlcv(self, symbol: str, timeframe: str = "1d", since: int = None, limit: int = None) -> list:
+        """
+        Candles of a symbol from `since` (milliseconds) on, at most `limit` of them and none after the current time.
+        """
+        step = parse_timeframe(timeframe)
+        limit = min(int(limit), self.max_candles) if limit else self.max_candles
+        latest = int(self.current_time() // step * step)
+        start = latest - (limit - 1) * step if since is None else math.ceil(int(since) / 1000 / step) * step
+
+        base = 50 + 1000 * _uniform(symbol, "base")
+        def close(t):
+            # Slow cycle plus per-candle noise, a function of time only
+            return base * math.exp(0.3 * math.sin(2 * math.pi * t / (90 * 86400)) + 0.05 * (_uniform(symbol, t, "close") - 0.5))
+
+        candles = []
+        for t in range(start, min(latest, start + (limit - 1) * step) + 1, step):
+            open_price, close_price = close(t - step), close(t)
+            high = max(open_price, close_price) * (1 + 0.02 * _uniform(symbol, t, "high"))
+            low = min(open_price, close_price) * (1 - 0.02 * _uniform(symbol, t, "low"))
+            volume = 1000 * (0.5 + _uniform(symbol, t, "volume"))
+            candles.append([t * 1000, round(open_price, 6), round(high, 6), round(low, 6), round(close_price, 6), round(volume, 3)])
+        return candles
+
+    def news(self, symbol: str, page: int = 0, from_date: str = None, to_date: str = None) -> list:
+        """
+        One page of a symbol's articles published between from_date and to_date (inclusive dates), newest first.
+        """
+        # Articles are evenly spaced, article k is published at news_start + k * news_interval
+        first = 0
+        last = math.floor((self.current_time() - self.news_start) / self.news_interval)
+        if from_date:
+            first = max(first, math.ceil((self._parse_date(from_date) - self.news_start) / self.news_interval))
+        if to_date:
+            last = min(last, math.ceil((self._parse_date(to_date) + 86400 - self.news_start) / self.news_interval) - 1)
+
+        top = last - int(page) * self.page_size
+        articles = []
+        for k in range(top, max(top - self.page_size, first - 1), -1):
+            published = datetime.fromtimestamp(self.news_start + k * self.news_interval, tz=timezone.utc)
+            articles.append({
+                "publishedDate": published.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "title": f"{symbol} market update #{k}",
+                "image": f"https://images.example.com/{symbol}/{k}.jpg",
+                "site": "example.com",
+                "text": f"Synthetic article {k} about {symbol}, sentiment {_uniform(symbol, k, 'sentiment'):.3f}.",
+                "url": f"https://news.example.com/{symbol}/{k}",
+                "symbol": symbol,
+            })
+        return articles
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+                if parsed.path == "/stats":
+                    with server.lock:
+                        return self._send(200, dict(server.stats))
+
+                status, delay = server._admit()
+                if delay > 0:
+                    time.sleep(delay)
+                if status == 429:
+                    return self._send(429, {"error": "Too Many Requests"},
+                                      {"Retry-After": str(max(1, math.ceil(server.rate_limit_window / server.rate_limit_requests)))})
+                if status is not None:
+                    return self._send(status, {"error": "Injected failure"})
+
+                try:
+                    if parsed.path == "/api/v1/ohlcv":
+                        with server.lock:
+                            server.stats["ohlcv"] += 1
+                        return self._send(200, server.ohlcv(query["symbol"],
+                                                            timeframe=query.get("timeframe", "1d"),
+                                                            since=query.get("since"),
+                                                            limit=query.get("limit")))
+                    if parsed.path == "/api/v4/crypto_news":
+                        with server.lock:
+                            server.stats["news"] += 1
+                        return self._send(200, server.news(query["symbol"],
+                                                           page=int(query.get("page", 0)),
+                                                           from_date=query.get("from"),
+                                                           to_date=query.get("to")))
+                except (KeyError, ValueError) as e:
+                    return self._send(400, {"error": f"Bad request: {e}"})
+                return self._send(404, {"error": "Not found"})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local mock exchange and news server for fetcher benchmarks")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate_limit_requests", type=int, default=None)
+    parser.add_argument("--rate_limit_window", type=float, default=60.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--now", type=str, default=None)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    server = MockMarketServer(**vars(args))
+    print(f"Serving mock market data on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
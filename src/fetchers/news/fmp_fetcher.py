@@ -7,13 +7,98 @@ import certifi
 import json
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-from ratelimit import limits, sleep_and_retry
+import math
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import shutil
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.fetchers.pacing import RequestPacer
 
 load_dotenv(verbose=True)
 
 ONE_MINUTE = 60
 MAX_CALLS_PER_MINUTE = 250
 
+NEWS_COLUMNS = ["timestamp", "title", "image", "site", "text", "url"]
+
+class NewsWriter:
+    """
+    Streams news pages into one CSV, dropping articles whose URL was already written.
+
+    Pages are buffered and appended to a temporary file in batches of `batch_size`
+    articles, so memory and time stay linear in the number of pages instead of
+    re-concatenating a growing frame per page. The file replaces the target on close, so
+    readers never see a partial download. The newest article written is tracked as the
+    high-water mark of the next incremental refresh.
+    """
+
+    def __init__(self, path: str, batch_size: int = 10000, append: bool = False):
+        """
+        Parameters:
+            path (str): CSV file the news end up in.
+            batch_size (int): Number of buffered articles that triggers a write.
+            append (bool): Keep the articles already in the file and add the new ones after them.
+        """
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.batch_size = batch_size
+        self.seen_urls = set()
+        self.num_articles = 0
+        self.buffer = []
+        self.buffer_size = 0
+        self.latest_timestamp = None
+        self.latest_urls = set()
+
+        if append and os.path.exists(path):
+            shutil.copyfile(path, self.tmp_path)
+            self.file = open(self.tmp_path, "a", newline="")
+        else:
+            self.file = open(self.tmp_path, "w", newline="")
+            pd.DataFrame(columns=NEWS_COLUMNS).to_csv(self.file, index=False)
+
+    def write(self, chunk_news: pd.DataFrame):
+        """
+        Append a page of news, without the articles seen before.
+        """
+        # Set lookups per article, `isin` would turn the whole set into an array for every page
+        keep = []
+        for url in chunk_news["url"]:
+            keep.append(url not in self.seen_urls)
+            self.seen_urls.add(url)
+        chunk_news = chunk_news.loc[keep, NEWS_COLUMNS]
+        if chunk_news.empty:
+            return
+
+        latest_timestamp = chunk_news["timestamp"].max()
+        if self.latest_timestamp is None or latest_timestamp > self.latest_timestamp:
+            self.latest_timestamp = latest_timestamp
+            self.latest_urls = set()
+        if latest_timestamp == self.latest_timestamp:
+            self.latest_urls.update(chunk_news.loc[chunk_news["timestamp"] == latest_timestamp, "url"])
+
+        self.buffer.append(chunk_news)
+        self.buffer_size += len(chunk_news)
+        self.num_articles += len(chunk_news)
+        if self.buffer_size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            pd.concat(self.buffer, axis=0).to_csv(self.file, header=False, index=False)
+        self.buffer = []
+        self.buffer_size = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
 class FMPCryptoNewsFetcher:
     def __init__(self,
                  root: str = "",
@@ -27,7 +112,26 @@ class FMPCryptoNewsFetcher:
                  cryptos_path: str = None,
                  workdir: str = "",
                  tag: str = "",
+                 max_workers: int = None,
+                 calls_per_minute: int = MAX_CALLS_PER_MINUTE,
+                 timeout: float = 30,
+                 incremental: bool = False,
+                 base_url: str = "https://financialmodelingprep.com",
+                 max_retries: int = 3,
+                 page_size: int = None,
                  **kwargs):
+        """
+        Parameters:
+            max_workers (int): Number of pages requested at the same time. Defaults to the quota in calls per second,
+                which keeps the quota busy with up to a second of latency per request.
+            calls_per_minute (int): API quota, the requests of all workers are spread evenly over the minute.
+            timeout (float): Timeout of a single request in seconds.
+            incremental (bool): Only fetch the news published since the high-water mark of the previous download.
+            base_url (str): Root of the news API, e.g. the url of a local MockMarketServer for benchmarks.
+            max_retries (int): Retries of a request that failed with a 429 or 5xx, with backoff and honouring Retry-After.
+            page_size (int): Number of articles on a full page of the API. A shorter page is the last one.
+                Defaults to the largest page seen so far.
+        """
         self.root = root
         self.api_key = api_key if api_key is not None else os.environ.get("OA_FMP_KEY")
         self.delay = delay
@@ -39,6 +143,23 @@ class FMPCryptoNewsFetcher:
         self.workdir = os.path.join(root, workdir, tag)
 
         self.max_pages = max_pages
+        self.page_size = page_size
+        self.calls_per_minute = calls_per_minute
+        self.max_workers = max_workers if max_workers is not None else max(1, math.ceil(calls_per_minute / ONE_MINUTE))
+        self.timeout = timeout
+        self.incremental = incremental
+        self.pacer = RequestPacer(ONE_MINUTE / calls_per_minute)
+
+        # One pooled session for all workers, so connections are reused instead of a new TLS handshake per page
+        self.session = requests.Session()
+        retry = Retry(total=max_retries,
+                      backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET"],
+                      respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         os.makedirs(self.workdir, exist_ok=True)
         self.log_path = os.path.join(self.workdir, "{}.txt".format(tag))
 
@@ -46,24 +167,213 @@ class FMPCryptoNewsFetcher:
             op.write("")
 
         self.cryptos = self._init_cryptos()
-        self.request_url = "https://financialmodelingprep.com/api/v4/crypto_news?symbol={}&page={}&from={}&to={}&apikey={}"
+        self.base_url = base_url.rstrip("/")
+        self.request_url = self.base_url + "/api/v4/crypto_news?symbol={}&page={}&from={}&to={}&apikey={}"
         
     def _init_cryptos(self):
         with open(self.cryptos_path) as op:
             cryptos = [line.strip() for line in op.readlines()]
         return cryptos
     
-    @sleep_and_retry
-    @limits(calls=MAX_CALLS_PER_MINUTE, period=ONE_MINUTE)
     def _get_jsonparsed_data(self, url):
-        response = urlopen(url, cafile=certifi.where())
-        data = response.read().decode("utf-8")
-        return json.loads(data)
+        self.pacer.wait()
+        response = self.session.get(url, timeout=self.timeout, verify=certifi.where())
+        response.raise_for_status()
+        return response.json()
 
     def check_status(self):
         failed_cryptos = self.cryptos
         return failed_cryptos
     
+    def _fetch_page(self, crypto, page, start_date, end_date, use_cache=True):
+        """
+        Load one page of news, from the page cache if it was downloaded before and use_cache is set.
+
+        Returns:
+            pd.DataFrame or None: The articles of the page, empty if the API returned no articles,
+            or None if the request failed.
+        """
+        # Check if page number has already been loaded and if so dont request it again
+        page_path = os.path.join(self.workdir, crypto, "page{:06d}.csv".format(page))
+        if use_cache and os.path.exists(page_path):
+            return pd.read_csv(page_path)
+
+        chunk_news = {
+            "timestamp": [],
+            "title": [],
+            "image": [],
+            "site": [],
+            "text": [],
+            "url": []
+        }
+        
+        # Format request url and contact API for news data
+        request_url = self.request_url.format(crypto, page, start_date, end_date, self.api_key)
+        try:
+            requested_data = self._get_jsonparsed_data(request_url)
+        except (TimeoutError, requests.RequestException) as e:
+            print(f"Request of {crypto} page {page} failed: {e}")
+            requested_data = None
+            
+        if not requested_data:
+            with open(self.log_path, "a") as op:
+                op.write("{},{}\n".format(crypto, page))
+            return None if requested_data is None else pd.DataFrame(chunk_news)
+        
+        for article in requested_data:
+            chunk_news["timestamp"].append(article["publishedDate"])
+            chunk_news["title"].append(article["title"])
+            chunk_news["image"].append(article["image"])
+            chunk_news["site"].append(article["site"])
+            chunk_news["text"].append(article["text"])
+            chunk_news["url"].append(article["url"])
+        
+        chunk_news = pd.DataFrame(chunk_news, index=range(len(chunk_news["timestamp"])))
+        chunk_news["timestamp"] = pd.to_datetime(chunk_news["timestamp"]).apply(
+            lambda x: x.strftime("%Y-%m-%d %H:%M:%S")
+        )
+        if use_cache:
+            chunk_news.to_csv(page_path, index=False)
+        return chunk_news
+
+    def _iter_pages(self, crypto, start_date, end_date):
+        """
+        Download the news pages of one crypto on the worker pool and yield them in page order.
+
+        Up to max_workers pages are in flight at once. Pages are numbered newest to oldest and
+        every page but the last one is full, so the first page that comes back short (or empty)
+        marks the end of the news: no page after it is requested and pages after it already
+        in flight are dropped, which keeps the quota spent past the end to the requests that
+        were in flight when the last page arrived. Failed requests are
+        logged and skipped without stopping the download. A page is yielded as soon as all
+        pages before it are done, so only the pages still waiting on an earlier one are held.
+
+        Yields:
+            pd.DataFrame: The articles of each non-empty page.
+        """
+        max_pages = self.max_pages if self.max_pages is not None else math.inf
+        stop_page = max_pages
+        page_size = self.page_size if self.page_size is not None else 0
+        page_lengths = {}
+        next_page = 0
+        next_yield = 0
+        done_pages = {}
+        in_flight = {}
+
+        pbar = tqdm(total=None if self.max_pages is None else self.max_pages,
+                    bar_format="Download {} News:".format(crypto) + "{bar:50}{percentage:3.0f}%|{elapsed}/{remaining}{postfix}")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                while next_page < stop_page and len(in_flight) < self.max_workers:
+                    future = executor.submit(self._fetch_page, crypto, next_page, start_date, end_date)
+                    in_flight[future] = next_page
+                    next_page += 1
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page = in_flight.pop(future)
+                    chunk_news = future.result()
+                    pbar.update(1)
+                    done_pages[page] = chunk_news
+                    if chunk_news is None:
+                        continue
+
+                    if len(chunk_news) == 0:
+                        stop_page = min(stop_page, page)
+                    page_lengths[page] = len(chunk_news)
+                    if self.page_size is None:
+                        page_size = max(page_size, len(chunk_news))
+
+                # A page that turned out shorter than a full one is the last page
+                short_pages = [page for page, length in page_lengths.items() if 0 < length < page_size]
+                if short_pages:
+                    stop_page = min(stop_page, min(short_pages) + 1)
+
+                while next_yield < stop_page and next_yield in done_pages:
+                    chunk_news = done_pages.pop(next_yield)
+                    next_yield += 1
+                    if chunk_news is not None:
+                        yield chunk_news
+        if stop_page < max_pages:
+            pbar.set_postfix_str(f"stopped at page {stop_page}")
+        pbar.close()
+    
+    def _mark_path(self, crypto):
+        return os.path.join(self.workdir, crypto, "high_water_mark.json")
+
+    def _load_mark(self, crypto):
+        """
+        Load the high-water mark of a crypto: the publish time of its newest stored article and the URLs published then.
+
+        Falls back to the crypto's news file for downloads made before marks were stored.
+
+        Returns:
+            dict or None: {"timestamp": str, "urls": list}, or None if nothing was downloaded yet.
+        """
+        mark_path = self._mark_path(crypto)
+        if os.path.exists(mark_path):
+            with open(mark_path) as op:
+                return json.load(op)
+
+        news_path = os.path.join(self.workdir, "{}.csv".format(crypto))
+        if not os.path.exists(news_path):
+            return None
+        news = pd.read_csv(news_path, usecols=["timestamp", "url"])
+        if news.empty:
+            return None
+        timestamp = news["timestamp"].max()
+        return {"timestamp": timestamp, "urls": sorted(news.loc[news["timestamp"] == timestamp, "url"])}
+
+    def _save_mark(self, crypto, timestamp, urls):
+        if timestamp is None:
+            return
+        mark_path = self._mark_path(crypto)
+        with open(f"{mark_path}.tmp", "w") as op:
+            json.dump({"timestamp": timestamp, "urls": sorted(urls)}, op)
+        os.replace(f"{mark_path}.tmp", mark_path)
+
+    def _refresh(self, crypto, mark, end_date):
+        """
+        Add the news published since the high-water mark to the crypto's news file.
+
+        Pages are requested newest first, one at a time and without the page cache (new
+        articles shift every page), until a page reaches an article at or before the mark.
+        A daily refresh therefore takes one or two requests. If a request fails the file
+        and mark are left untouched, so the next refresh starts from the same mark.
+        """
+        mark_urls = set(mark["urls"])
+        writer = NewsWriter(os.path.join(self.workdir, "{}.csv".format(crypto)), append=True)
+        writer.seen_urls.update(mark_urls)
+        writer.latest_timestamp = mark["timestamp"]
+        writer.latest_urls = set(mark_urls)
+
+        max_pages = self.max_pages if self.max_pages is not None else math.inf
+        num_requests = 0
+        try:
+            for page in count():
+                if page >= max_pages:
+                    break
+                chunk_news = self._fetch_page(crypto, page, mark["timestamp"][:10], end_date, use_cache=False)
+                num_requests += 1
+                if chunk_news is None:
+                    raise RuntimeError(f"Request of {crypto} page {page} failed")
+                if chunk_news.empty:
+                    break
+
+                known = (chunk_news["timestamp"] < mark["timestamp"]) | chunk_news["url"].isin(mark_urls)
+                writer.write(chunk_news[~known])
+                if known.any():
+                    break
+        except BaseException:
+            writer.abort()
+            raise
+
+        writer.close()
+        self._save_mark(crypto, writer.latest_timestamp, writer.latest_urls)
+        print(f"Added {writer.num_articles} new {crypto} articles since {mark['timestamp']} in {num_requests} requests")
+    
     def download(self,
                  cryptos = None,
                  start_date = None,
@@ -73,57 +383,28 @@ class FMPCryptoNewsFetcher:
             start_date = self.start_date
         if end_date is None:
             end_date = self.end_date
+        if cryptos is None:
+            cryptos = self.cryptos
             
         for crypto in cryptos:
             os.makedirs(os.path.join(self.workdir, crypto), exist_ok=True)
-            crypto_news = pd.DataFrame()
-            
-            for page in tqdm(range(self.max_pages), 
-                            bar_format="Download {} News:".format(crypto) + "{bar:50}{percentage:3.0f}%|{elapsed}/{remaining}{postfix}"):
-                
-                # Check if page number has already been loaded and if so dont request it again
-                page_path = os.path.join(self.workdir, crypto, "page{:06d}.csv".format(page))
-                if os.path.exists(page_path):
-                    chunk_news = pd.read_csv(page_path)
-                else:
-                    chunk_news = {
-                        "timestamp": [],
-                        "title": [],
-                        "image": [],
-                        "site": [],
-                        "text": [],
-                        "url": []
-                    }
-                    
-                    # Format request url and contact API for news data
-                    request_url = self.request_url.format(crypto, page, start_date, end_date, self.api_key)
+
+            if self.incremental:
+                mark = self._load_mark(crypto)
+                if mark is not None:
                     try:
-                        requested_data = self._get_jsonparsed_data(request_url)
-                    except TimeoutError:
-                        print("Time out.")
-                        requested_data = []
-                        
-                    if len(requested_data) == 0:
-                        with open(self.log_path, "a") as op:
-                            op.write("{},{}\n".format(crypto, page))
-                        continue
-                    
-                    for article in requested_data:
-                        chunk_news["timestamp"].append(article["publishedDate"])
-                        chunk_news["title"].append(article["title"])
-                        chunk_news["image"].append(article["image"])
-                        chunk_news["site"].append(article["site"])
-                        chunk_news["text"].append(article["text"])
-                        chunk_news["url"].append(article["url"])
-                    
-                    chunk_news = pd.DataFrame(chunk_news, index=range(len(chunk_news["timestamp"])))
-                    chunk_news["timestamp"] = pd.to_datetime(chunk_news["timestamp"]).apply(
-                        lambda x: x.strftime("%Y-%m-%d %H:%M:%S")
-                    )
-                    chunk_news.to_csv(page_path, index=False)
-                    
-                crypto_news = pd.concat([crypto_news, chunk_news], axis=0)
-            crypto_news.to_csv(os.path.join(self.workdir, "{}.csv".format(crypto)), index=False)
-               
-                    
-                
\ No newline at end of file
+                        self._refresh(crypto, mark, end_date)
+                    except RuntimeError as e:
+                        print(f"Refreshing {crypto} news failed, keeping the previous download: {e}")
+                    continue
+
+            # Pages are appended to the crypto's file as they arrive instead of concatenated into a growing frame
+            writer = NewsWriter(os.path.join(self.workdir, "{}.csv".format(crypto)))
+            try:
+                for chunk_news in self._iter_pages(crypto, start_date, end_date):
+                    writer.write(chunk_news)
+            except BaseException:
+                writer.abort()
+                raise
+            writer.close()
+            self._save_mark(crypto, writer.latest_timestamp, writer.latest_urls)
@@ -0,0 +1,32 @@
+import threading
+import time
+
+class RequestPacer:
+    """
+    Spaces out the requests of several threads to one API.
+
+    Each request reserves the next free slot on a shared schedule, so request starts are
+    at least `min_interval` seconds apart however many threads are downloading. For an
+    exchange this is the spacing ccxt's `enableRateLimit` applies, made safe to share
+    across threads; for a per-minute quota it spreads the calls evenly over the minute.
+    """
+
+    def __init__(self, min_interval: float = 0.0):
+        """
+        Parameters:
+            min_interval (float): Minimum time between two request starts in seconds.
+        """
+        self.min_interval = min_interval
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the calling thread may send its request.
+        """
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
@@ -10,6 +10,15 @@ from datetime import datetime, timedelta
 from ratelimit import limits, sleep_and_retry
 import ccxt
 import numpy as np
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.fetchers.pacing import RequestPacer
+from src.fetchers.prices.mock_exchange import MockExchange
+
+# Exchanges that are not part of ccxt, by name
+CUSTOM_EXCHANGES = {
+    "mock": MockExchange,
+}
 
 class CCXTPriceFetcher:
     
@@ -26,6 +35,10 @@ class CCXTPriceFetcher:
         tag: str = "",
         limit: int = None,
         delay: float = 1.0,
+        max_workers: int = 1,
+        requests_per_second: float = None,
+        incremental: bool = False,
+        exchange_config: dict = None,
         **kwargs
     ):
         """
@@ -33,7 +46,7 @@ class CCXTPriceFetcher:
         
         Parameters:
             root (str): Root directory for relative paths.
-            exchange_name (str): Name of the exchange (e.g., 'okx', 'coinbase').
+            exchange_name (str): Name of the exchange (e.g., 'okx', 'coinbase'), or 'mock' for a local MockMarketServer.
             api_key (str): Optional API key (not always required for public OHLCV).
             start_date (str): Start date (YYYY-MM-DD).
             end_date (str): End date (YYYY-MM-DD).
@@ -42,7 +55,12 @@ class CCXTPriceFetcher:
             workdir (str): Directory to store output data.
             tag (str): Additional tag for output directory.
             limit (int): Max candles per fetch_ohlcv call.
-            delay (float): Delay between requests in seconds.
+            delay (float): Delay between requests in seconds when fetching serially.
+            max_workers (int): Number of symbols fetch_all downloads at the same time.
+            requests_per_second (float): Request rate shared by all workers. Defaults to the exchange's own rate limit.
+            incremental (bool): Resume existing CSVs from their last stored candle instead of downloading from start_date.
+            exchange_config (dict): Extra ccxt exchange options, e.g. {'urls': {'api': {'public': 'http://127.0.0.1:8765'}}}
+                for the mock exchange or {'options': {'maxRetriesOnFailure': 3}} to retry network errors.
         """
         self.root = root
         self.api_key = api_key
@@ -51,6 +69,8 @@ class CCXTPriceFetcher:
         self.interval = interval
         self.limit = limit
         self.delay = delay
+        self.max_workers = max_workers
+        self.incremental = incremental
 
         if cryptos_path is not None:
             self.cryptos_path = os.path.join(root, cryptos_path)
@@ -64,11 +84,23 @@ class CCXTPriceFetcher:
         self.cryptos = self._init_cryptos()
         
         # Dynamically create exchange instance
-        if not hasattr(ccxt, exchange_name):
+        if exchange_name in CUSTOM_EXCHANGES:
+            exchange_class = CUSTOM_EXCHANGES[exchange_name]
+        elif hasattr(ccxt, exchange_name):
+            exchange_class = getattr(ccxt, exchange_name)
+        else:
             raise ValueError(f"Exchange {exchange_name} is not supported by ccxt.")
-        exchange_class = getattr(ccxt, exchange_name)
         print(str(exchange_class))
-        self.exchange = exchange_class({'enableRateLimit': True})
+        # Requests are paced by self.pacer, which unlike ccxt's own throttle is shared safely by all workers
+        self.exchange = exchange_class({**(exchange_config or {}), 'enableRateLimit': False})
+
+        # ccxt's rateLimit is the number of milliseconds between two requests
+        if requests_per_second is None:
+            requests_per_second = 1000.0 / self.exchange.rateLimit if self.exchange.rateLimit else None
+        self.pacer = RequestPacer(1.0 / requests_per_second if requests_per_second else 0.0)
+
+        self.stats = {"requests": 0, "candles": 0}
+        self.stats_lock = threading.Lock()
         
     def _init_cryptos(self):
         if self.cryptos_path is None or not os.path.exists(self.cryptos_path):
@@ -80,39 +112,186 @@ class CCXTPriceFetcher:
     def _parse_date(self, date_str: str):
         return int(datetime.strptime(date_str, "%Y-%m-%d").timestamp() * 1000)
 
-    def fetch_all(self):
+    @staticmethod
+    def _read_last_candle(path: str):
+        """
+        Find the last candle of a CSV written by fetch_symbol without parsing the whole file.
+
+        Returns:
+            tuple or None: Byte offset where the last row starts and its timestamp in milliseconds,
+            or None if the file holds no candles.
+        """
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            block = 4096
+            while True:
+                start = max(size - block, 0)
+                f.seek(start)
+                tail = f.read(size - start)
+                lines = tail.rstrip(b"\r\n").split(b"\n")
+                # The last row is complete once a newline precedes it, or it starts the file
+                if len(lines) > 1 or start == 0:
+                    break
+                block *= 2
+
+        if start == 0 and len(lines) <= 1:
+            # Header only
+            return None
+        last_line = lines[-1]
+        offset = start + len(tail.rstrip(b"\r\n")) - len(last_line)
+        timestamp = last_line.split(b",")[0].decode()
+        return offset, int(pd.Timestamp(timestamp).timestamp() * 1000)
+
+    @staticmethod
+    def _append_candles(path: str, offset: int, results: pd.DataFrame):
+        """
+        Replace the rows of a CSV from the byte offset on with new candles, atomically.
+
+        The kept part is copied byte for byte and the file is swapped in with a rename, so
+        readers see either the old or the new file and an interrupted refresh leaves the old
+        file untouched.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            remaining = offset
+            while remaining > 0:
+                chunk = src.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                dst.write(chunk)
+                remaining -= len(chunk)
+        results.to_csv(tmp_path, mode="a", header=False, index=False)
+        os.replace(tmp_path, path)
+
+    def _count(self, requests: int = 0, candles: int = 0):
+        with self.stats_lock:
+            self.stats["requests"] += requests
+            self.stats["candles"] += candles
+
+    def fetch_all(self, max_workers: int = None):
         """
         Fetch OHLCV data for all cryptos in self.cryptos and save to CSV.
+
+        With more than one worker the symbols are downloaded concurrently. The requests of
+        all workers share the exchange's rate limit, so the download runs as fast as the
+        exchange allows instead of waiting out one symbol's requests after another. A
+        symbol that fails is reported and skipped instead of stopping the others.
+
+        Parameters:
+            max_workers (int): Number of symbols downloaded at the same time. Defaults to self.max_workers.
+
+        Returns:
+            dict: Download report with the number of symbols, failed symbols, requests, candles and throughput.
         """
-        for crypto in self.cryptos:
-            self.fetch_symbol(crypto)
+        max_workers = self.max_workers if max_workers is None else max_workers
+        with self.stats_lock:
+            self.stats = {"requests": 0, "candles": 0}
+        failed = []
+        start_time = time.time()
+
+        if max_workers <= 1:
+            for crypto in self.cryptos:
+                try:
+                    self.fetch_symbol(crypto)
+                except Exception as e:
+                    print(f"Failed to fetch {crypto}: {e}")
+                    failed.append(crypto)
+        else:
+            pbar = tqdm(total=len(self.cryptos), desc="Fetching OHLCV", unit="symbol")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self.fetch_symbol, crypto, delay=0, progress=False): crypto
+                    for crypto in self.cryptos
+                }
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Failed to fetch {futures[future]}: {e}")
+                        failed.append(futures[future])
+
+                    elapsed = max(time.time() - start_time, 1e-9)
+                    pbar.update(1)
+                    pbar.set_postfix(req_per_s=f"{self.stats['requests'] / elapsed:.2f}",
+                                     candles=self.stats["candles"])
+            pbar.close()
+
+        elapsed = max(time.time() - start_time, 1e-9)
+        report = {
+            "symbols": len(self.cryptos),
+            "failed": failed,
+            "requests": self.stats["requests"],
+            "candles": self.stats["candles"],
+            "seconds": round(elapsed, 3),
+            "requests_per_second": round(self.stats["requests"] / elapsed, 3),
+            "candles_per_second": round(self.stats["candles"] / elapsed, 3),
+        }
+        print(f"Fetched {report['symbols'] - len(failed)}/{report['symbols']} symbols, "
+              f"{report['candles']} candles in {report['requests']} requests "
+              f"over {report['seconds']:.1f}s ({report['requests_per_second']:.2f} req/s, "
+              f"{report['candles_per_second']:.1f} candles/s)")
+        return report
             
-    def fetch_symbol(self, symbol: str):
+    def fetch_symbol(self, symbol: str, delay: float = None, progress: bool = True, incremental: bool = None):
         """
         Fetch OHLCV data for a single symbol between start_date and end_date.
+
+        In incremental mode an existing CSV is resumed from its last stored candle: only that
+        candle and newer ones are requested, the refetched boundary candle replaces the stored
+        one (it may have been incomplete when stored) and the new rows are appended, so a
+        daily refresh takes a single request.
+
+        Parameters:
+            symbol (str): Symbol to fetch, e.g. 'BTC/USDT'.
+            delay (float): Delay between requests in seconds. Defaults to self.delay.
+            progress (bool): Show a progress bar of the requests.
+            incremental (bool): Resume from the stored CSV. Defaults to self.incremental.
+
+        Returns:
+            pd.DataFrame: The candles written by this call, empty if there was nothing new to store.
         """
+        delay = self.delay if delay is None else delay
+        incremental = self.incremental if incremental is None else incremental
         
         start_ts = self._parse_date(self.start_date)
         end_ts = self._parse_date(self.end_date)
+        save_path = os.path.join(self.workdir, "{}_{}.csv".format(symbol, self.interval))
         
         all_data = []
+        columns = ["timestamp", "open", "high", "low", "close", "volume"]
 
         # We will keep fetching data until we reach end_date or run out of data
         since = start_ts
         end = end_ts
+
+        resume = None
+        if incremental and os.path.exists(save_path):
+            resume = self._read_last_candle(save_path)
+        if resume is not None:
+            since = resume[1]
+            if since > end:
+                print(f"{symbol} is already up to date in {save_path}")
+                return pd.DataFrame(columns=columns)
+
+        # Open time of the newest candle the exchange can have, there is nothing to page to after it
+        timeframe_ms = self.exchange.parse_timeframe(self.interval) * 1000
+        latest_ts = self.exchange.milliseconds() // timeframe_ms * timeframe_ms
         
-        pbar = tqdm(desc=f"Fetching {symbol} OHLCV", unit="req")
+        pbar = tqdm(desc=f"Fetching {symbol} OHLCV", unit="req", disable=not progress)
         while True:
             pbar.update(1)
+            self.pacer.wait()
             data = self.exchange.fetchOHLCV(symbol,
                                              timeframe=self.interval,
                                              since=since,
                                              limit=self.limit)
+            self._count(requests=1)
             
             if not data:
                 break
             
-            data = pd.DataFrame(data, columns=["timestamp", "open", "high", "low", "close", "volume"])
+            data = pd.DataFrame(data, columns=columns)
             data = data.sort_values("timestamp").reset_index(drop=True)
             data = data[data["timestamp"] <= end]
             
@@ -120,27 +299,35 @@ class CCXTPriceFetcher:
                 break
             
             all_data.append(data)
+            self._count(candles=len(data))
             
             last_ts = data["timestamp"].iloc[-1]
-            if last_ts >= end:
+            if last_ts >= end or last_ts >= latest_ts:
                 break
             
             since = last_ts + 1
-            time.sleep(self.delay)
+            if delay:
+                time.sleep(delay)
         
         pbar.close()
         
         if not all_data:
             # No data fetched
             print(f"No data fetched for {symbol} in the given date range.")
-            return []
+            return pd.DataFrame(columns=columns)
         
         results = pd.concat(all_data, ignore_index=True)
+        results = results.drop_duplicates(subset=["timestamp"], keep="last")
         results["timestamp"] = pd.to_datetime(results["timestamp"], unit='ms').apply(
             lambda x: x.strftime("%Y-%m-%d %H:%M:%S")
         )
-        results = results[["timestamp", "open", "high", "low", "close", "volume"]]
+        results = results[columns]
         
-        save_path = os.path.join(self.workdir, "{}_{}.csv".format(symbol, self.interval))
+        if resume is not None:
+            self._append_candles(save_path, resume[0], results)
+            print(f"Appended {len(results)} {symbol} candles to {save_path}")
+            return results
+
         results.to_csv(save_path, index=False)
-        print(f"Saved {symbol} data to {save_path}")
\ No newline at end of file
+        print(f"Saved {symbol} data to {save_path}")
+        return results
\ No newline at end of file
@@ -0,0 +1,53 @@
+import ccxt
+
+class MockExchange(ccxt.Exchange):
+    """
+    Minimal ccxt exchange that downloads candles from a local MockMarketServer.
+
+    Requests go through ccxt's own request path (rate limiting, retries on network
+    errors, HTTP status to exception mapping), so the price fetcher behaves against it as
+    it does against a real exchange. Point it at a server with
+    {'urls': {'api': {'public': 'http://host:port'}}} and tune the pacing with 'rateLimit'.
+    """
+
+    def describe(self):
+        return self.deep_extend(super(MockExchange, self).describe(), {
+            'id': 'mock',
+            'name': 'Mock',
+            'rateLimit': 50,
+            'has': {
+                'fetchOHLCV': True,
+            },
+            'timeframes': {
+                '1m': '1m',
+                '5m': '5m',
+                '15m': '15m',
+                '1h': '1h',
+                '4h': '4h',
+                '1d': '1d',
+                '1w': '1w',
+            },
+            'urls': {
+                'api': {
+                    'public': 'http://127.0.0.1:8765',
+                },
+            },
+        })
+
+    def sign(self, path, api='public', method='GET', params={}, headers=None, body=None):
+        url = self.urls['api'][api] + '/' + path
+        if params:
+            url += '?' + self.urlencode(params)
+        return {'url': url, 'method': method, 'body': body, 'headers': headers}
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        request = {
+            'symbol': symbol,
+            'timeframe': self.timeframes.get(timeframe, timeframe),
+        }
+        if since is not None:
+            request['since'] = since
+        if limit is not None:
+            request['limit'] = limit
+        response = self.fetch2('api/v1/ohlcv', 'public', 'GET', self.extend(request, params))
+        return [[int(candle[0])] + [float(value) for value in candle[1:6]] for candle in response]
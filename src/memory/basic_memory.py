@@ -10,6 +10,7 @@ from typing import (
 import time
 import json
 import os
+import threading
 
 from src.memory.base import VectorStore, BaseMemory, Image
 
@@ -38,6 +39,7 @@ class MemoryUnit(BaseMemory):
         
         self.memory_path = memory_path
         self.vectorstore = vectorstore
+        self._lock = threading.Lock()
         
     def add(
         self,
@@ -52,14 +54,16 @@ class MemoryUnit(BaseMemory):
             data (Dict): A dictionary containing the information you want to store.
             embedding_key (str): A string that tells the function which part of 'data' contains the embedding.
         '''
-        # Create a unique id for the data and store it in memory
-        name = time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime()) # unique id of the added data
-        self.memory[name] = data
-        
         assert embedding_key in data, f"embedding_key {embedding_key} not in data."
         embeddings = data[embedding_key]
         
-        self.vectorstore.add_embeddings([name], [embeddings])
+        with self._lock:
+            # Create a unique id for the data and store it in memory. Several entries are often
+            # added within the same second, so the timestamp is followed by the insertion count.
+            name = "{}-{:06d}".format(time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime()), len(self.memory))
+            self.memory[name] = data
+            
+            self.vectorstore.add_embeddings([name], [embeddings])
         
     def similarity_search(
         self, 
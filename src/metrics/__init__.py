@@ -4,4 +4,5 @@ from .metrics import CR
 from .metrics import SOR
 from .metrics import DD
 from .metrics import MDD
-from .metrics import VOL
\ No newline at end of file
+from .metrics import VOL
+from .usage import UsageTracker
\ No newline at end of file
@@ -0,0 +1,99 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Any
+
+from src.utils import save_json
+
+# USD per one million tokens as (prompt, completion)
+MODEL_PRICING = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-2024-08-06": (2.50, 10.00),
+    "gpt-4o-2024-11-20": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo-0613": (1.50, 2.00),
+    "gpt-3.5-turbo-16k-0613": (3.00, 4.00),
+}
+
+def _empty_totals() -> Dict[str, Any]:
+    return {
+        "calls": 0,
+        "cached_calls": 0,
+        "offline_calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "latency": 0.0,
+        "cost": 0.0,
+    }
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    '''Estimated cost in USD of a completion, or 0 if the model has no known pricing.'''
+    if model not in MODEL_PRICING:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICING[model]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+class UsageTracker():
+    '''Aggregates token usage, latency and estimated cost of LLM calls.
+
+    Every call is recorded under the prompt stage that issued it and the trading date
+    it belongs to, and summed per stage, per day and for the whole run.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.run = _empty_totals()
+        self.stages = defaultdict(_empty_totals)
+        self.days = defaultdict(lambda: defaultdict(_empty_totals))
+
+    def record(self,
+               stage: str,
+               model: str,
+               info: Dict[str, int],
+               latency: float,
+               date: str = None) -> None:
+        '''
+        Records one completion call.
+
+        :param stage: Name of the prompt stage (e.g. the prompt class name).
+        :param model: Model used for the call.
+        :param info: Usage info returned by the provider's create_completion.
+        :param latency: Wall time of the call in seconds.
+        :param date: Trading date the call belongs to.
+        '''
+        cached = bool(info.get("cached", False))
+        offline = bool(info.get("offline", False))
+        prompt_tokens = int(info.get("prompt_tokens", 0))
+        completion_tokens = int(info.get("completion_tokens", 0))
+
+        # Cached and offline completions never reach the paid API
+        cost = 0.0 if cached or offline else estimate_cost(model, prompt_tokens, completion_tokens)
+
+        with self._lock:
+            buckets = [self.run, self.stages[stage]]
+            if date is not None:
+                buckets.append(self.days[date][stage])
+
+            for totals in buckets:
+                totals["calls"] += 1
+                totals["cached_calls"] += int(cached)
+                totals["offline_calls"] += int(offline)
+                totals["prompt_tokens"] += prompt_tokens
+                totals["completion_tokens"] += completion_tokens
+                totals["total_tokens"] += int(info.get("total_tokens", prompt_tokens + completion_tokens))
+                totals["latency"] += latency
+                totals["cost"] += cost
+
+    def summary(self) -> Dict[str, Any]:
+        '''Returns the aggregated usage as a JSON serializable dict.'''
+        with self._lock:
+            return {
+                "run": dict(self.run),
+                "stages": {stage: dict(totals) for stage, totals in self.stages.items()},
+                "days": {date: {stage: dict(totals) for stage, totals in stages.items()}
+                         for date, stages in sorted(self.days.items())},
+            }
+
+    def save(self, path: str) -> None:
+        save_json(self.summary(), path)
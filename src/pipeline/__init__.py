@@ -0,0 +1,3 @@
+from .scheduler import Stage, StageScheduler
+from .prefetch import StepPrefetcher
+from .context import LayeredParams
\ No newline at end of file
@@ -0,0 +1,29 @@
+from collections import ChainMap
+from typing import Any, Dict, Mapping
+
+class LayeredParams(ChainMap):
+    '''Copy-on-write view over the params of a step.
+
+    Writes land in the top layer while reads fall through to the layers below, so a
+    stage can add or override params without copying the ones it was given. Parent
+    layers are never written through this view. Values are shared with the parents
+    rather than copied, so they must be replaced, not mutated in place.
+    '''
+
+    @classmethod
+    def over(cls, params: Mapping[str, Any]) -> "LayeredParams":
+        '''
+        Starts a new writable layer on top of the given params.
+
+        :param params: Params to read through to. Left untouched.
+        :return: A view whose writes only go to its own layer.
+        '''
+        return cls({}, params)
+
+    def changes(self) -> Dict[str, Any]:
+        '''Params written to the top layer.'''
+        return dict(self.maps[0])
+
+    def to_dict(self) -> Dict[str, Any]:
+        '''Flattens all layers into a plain dict (a shallow copy, e.g. to store or serialize).'''
+        return dict(self)
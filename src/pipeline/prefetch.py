@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class StepPrefetcher():
+    '''Prepares the inputs of upcoming steps in the background.
+
+    While the current step waits on the LLM, the deterministic inputs of the next step
+    (its state window, kline chart and rendered prompt sections) can already be built.
+    Work is submitted under a key (usually the day index) and collected with `pop`
+    when that step starts; a step that was never submitted simply gets None and
+    computes its inputs itself.
+    '''
+
+    def __init__(self, max_workers: int = 1) -> None:
+        '''
+        :param max_workers: Number of background workers. One is enough to stay a step ahead.
+        '''
+        self.executor = ThreadPoolExecutor(max_workers=max(int(max_workers), 1),
+                                           thread_name_prefix="prefetch")
+        self.futures: Dict[Hashable, Future] = {}
+
+    def submit(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> None:
+        '''Starts preparing the inputs of a step unless they are already being prepared.'''
+        if key in self.futures:
+            return
+        self.futures[key] = self.executor.submit(fn, *args, **kwargs)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        '''
+        Waits for and returns the prepared inputs of a step.
+
+        :param key: Key the work was submitted under.
+        :return: The prepared inputs, or None if nothing was submitted or preparing them failed.
+        '''
+        future = self.futures.pop(key, None)
+        if future is None:
+            return None
+
+        try:
+            return future.result()
+        except Exception as e:
+            # The step falls back to computing its inputs itself
+            print(f"Prefetching {key} failed: {e}")
+            return None
+
+    def close(self) -> None:
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List
+
+class Stage():
+    '''A unit of work in a step, declared by the params it reads and the params it produces.'''
+
+    def __init__(self,
+                 name: str,
+                 fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 inputs: List[str] = None,
+                 outputs: List[str] = None) -> None:
+        '''
+        :param name: Name of the stage, used in error messages.
+        :param fn: Callable taking a snapshot of the params and returning a dict of new params.
+        :param inputs: Param keys that must be available before the stage may start.
+        :param outputs: Param keys the stage adds to the params.
+        '''
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs or [])
+        self.outputs = list(outputs or [])
+
+class StageScheduler():
+    '''Runs a DAG of stages, starting every stage as soon as all of its inputs exist.
+
+    Stages run on a thread pool, so stages that wait on the network (LLM or embedding
+    calls) overlap and a step takes roughly as long as its critical path. Every stage
+    gets its own shallow snapshot of the params taken when it starts; its returned
+    outputs are merged back by the scheduler thread, so stages never write the shared
+    dict concurrently. Stages whose outputs are all present already (e.g. prepared
+    ahead of time) are skipped.
+    '''
+
+    def __init__(self,
+                 stages: List[Stage],
+                 max_workers: int = 4) -> None:
+        self.stages = stages
+        self.max_workers = max(int(max_workers), 1)
+        self._check_graph()
+
+    def _check_graph(self) -> None:
+        names = [stage.name for stage in self.stages]
+        if len(names) != len(set(names)):
+            raise ValueError(f"Stage names must be unique: {names}")
+
+        produced = {}
+        for stage in self.stages:
+            for key in stage.outputs:
+                if key in produced:
+                    raise ValueError(f"Param {key} is produced by both {produced[key]} and {stage.name}.")
+                produced[key] = stage.name
+
+    def run(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        '''
+        Runs all stages.
+
+        :param params: Initial params. Updated in place with the outputs of every stage.
+        :return: The updated params.
+        '''
+        pending = [stage for stage in self.stages
+                   if not stage.outputs or not all(key in params for key in stage.outputs)]
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                ready = [stage for stage in pending if all(key in params for key in stage.inputs)]
+                for stage in ready:
+                    pending.remove(stage)
+                    running[executor.submit(stage.fn, dict(params))] = stage
+
+                if not running:
+                    missing = {stage.name: [key for key in stage.inputs if key not in params]
+                               for stage in pending}
+                    raise ValueError(f"Stages can never start, missing inputs: {missing}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    outputs = future.result() or {}
+                    missing = [key for key in stage.outputs if key not in outputs]
+                    if missing:
+                        raise KeyError(f"Stage {stage.name} did not produce {missing}")
+                    params.update(outputs)
+
+        return params
@@ -1,2 +1,4 @@
 from .plots_interface import PlotsInterface
-from .charts import plot_kline, plot_trading
\ No newline at end of file
+from .charts import plot_kline, plot_trading, TradingChart
+from .image import ChartImage
+from .cache import ChartCache, chart_key
\ No newline at end of file
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+# Bump when the drawing code changes so charts cached by an older version are not reused
+CHART_VERSION = "kline-2"
+
+def chart_key(price: pd.DataFrame, indicators: Optional[pd.DataFrame] = None, **params: Any) -> str:
+    '''
+    Content hash of a chart: the OHLCV bytes of its window, the indicators drawn on it and the rendering parameters.
+
+    :param price: OHLCV bars of the window, indexed by timestamp.
+    :param indicators: Precomputed indicators of the window, if any.
+    :param params: Rendering parameters such as title, mode, dpi or figsize.
+    :return: Hex digest identifying the chart.
+    '''
+    digest = hashlib.sha256(CHART_VERSION.encode())
+    digest.update(np.asarray(price.index.values, dtype="datetime64[ns]").tobytes())
+    digest.update(np.ascontiguousarray(price[["open", "high", "low", "close", "volume"]].values, dtype=np.float64).tobytes())
+    if indicators is not None:
+        indicators = indicators.reindex(price.index)[["sma", "bbl", "bbu"]]
+        digest.update(np.ascontiguousarray(indicators.values, dtype=np.float64).tobytes())
+    for name in sorted(params):
+        digest.update(f"{name}={params[name]!r};".encode())
+    return digest.hexdigest()
+
+class ChartCache():
+    '''Size-capped, content-addressed store of rendered charts on disk.
+
+    Charts are stored as `<key>.<suffix>` in one directory, so re-running a range finds
+    the charts of identical windows no matter which date or run produced them. When the
+    directory grows past `max_bytes` the least recently used charts are evicted. Safe
+    to use from the render pool's threads.
+    '''
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024) -> None:
+        '''
+        :param cache_dir: Directory the charts are stored in.
+        :param max_bytes: Size cap of the directory, least recently used charts are evicted beyond it.
+        '''
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Key to (file name, size), least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        files = [entry for entry in os.scandir(self.cache_dir) if entry.is_file() and not entry.name.endswith(".tmp")]
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            key = entry.name.split(".")[0]
+            size = entry.stat().st_size
+            self.entries[key] = (entry.name, size)
+            self.total_bytes += size
+
+        with self.lock:
+            self._evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        '''
+        :param key: Chart key, see chart_key.
+        :return: The cached image bytes, or None on a miss.
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+
+        path = os.path.join(self.cache_dir, entry[0])
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            # Removed behind our back, treat as a miss
+            with self.lock:
+                if self.entries.pop(key, None) is not None:
+                    self.total_bytes -= entry[1]
+            return None
+        return data
+
+    def put(self, key: str, data: bytes, suffix: str = "png") -> None:
+        '''
+        Stores a rendered chart and evicts the least recently used charts beyond the size cap.
+
+        :param key: Chart key, see chart_key.
+        :param data: Encoded image bytes.
+        :param suffix: File extension of the image.
+        '''
+        name = f"{key}.{suffix}"
+        path = os.path.join(self.cache_dir, name)
+
+        # Unique temporary file, two threads may store the same chart at once
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[key] = (name, len(data))
+            self.total_bytes += len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (name, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
@@ -1,11 +1,35 @@
-import matplotlib.pyplot as plt
+import io
+import os
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import matplotlib.ticker as mtick
-from matplotlib.dates import DateFormatter
+from matplotlib.dates import DateFormatter, DayLocator, date2num
 import pandas as pd
 import pandas_ta as ta
+from PIL import Image
 import numpy as np
 
-def plot_kline(df, title, save_path, now_date, mode="train"):
+def encode_canvas(canvas, image_format="png"):
+    '''Rasterizes an Agg canvas once and encodes its buffer directly, savefig would draw the figure a second time.'''
+    canvas.draw()
+    image = Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba(), "raw", "RGBA", 0, 1).convert("RGB")
+    buffer = io.BytesIO()
+    if image_format == "png":
+        # Fast zlib level, PNG encoding otherwise dominates the render time
+        image.save(buffer, format="png", compress_level=1)
+    else:
+        image.save(buffer, format=image_format, quality=90)
+    return buffer.getvalue()
+
+def plot_kline(df, title, save_path, now_date, mode="train", dpi=300, figsize=(12, 8), image_format="png", indicators=None):
+    '''Draws a kline chart with SMA and Bollinger Bands and returns the encoded image bytes.
+    The image is also written to save_path unless it is None.
+
+    Candles are drawn as two vectorized line collections on a standalone Agg figure, so
+    the cost barely grows with the number of candles and charts can be drawn from
+    several threads without touching pyplot's global state. Indicators precomputed by an
+    IndicatorEngine can be passed in; otherwise they are computed over the window.'''
     
     # Convert date to useable date
     now_date = pd.to_datetime(now_date)
@@ -14,27 +38,33 @@ def plot_kline(df, title, save_path, now_date, mode="train"):
     if mode != "train":
         df = df[df.index <= now_date]
 
-    # Calculate indicators
-    df['sma_5'] = ta.sma(df["close"], length=5)
-    bbands = ta.bbands(df["close"], length=5)
-    df['bbl'] = bbands.iloc[:, 0]
-    df['bbu'] = bbands.iloc[:, 2]
-    df['bbp'] = bbands.iloc[:, 4]
+    # Calculate indicators, without writing them into the caller's frame
+    if indicators is not None:
+        indicators = indicators.reindex(df.index)
+        sma_5 = indicators['sma']
+        bbl = indicators['bbl']
+        bbu = indicators['bbu']
+    else:
+        sma_5 = ta.sma(df["close"], length=5)
+        bbands = ta.bbands(df["close"], length=5)
+        bbl = bbands.iloc[:, 0]
+        bbu = bbands.iloc[:, 2]
 
     # Create the figure and axis
-    fig, ax = plt.subplots(figsize=(12, 8))
+    fig = Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.subplots()
 
     # Candlestick plot
-    for idx, row in df.iterrows():
-        color = 'green' if row['close'] >= row['open'] else 'red'
-        # Plot the candlestick body
-        ax.plot([idx, idx], [row['low'], row['high']], color='black', linewidth=0.5)  # Wicks
-        ax.plot([idx, idx], [row['open'], row['close']], color=color, linewidth=6)  # Body
+    dates = df.index
+    colors = np.where(df['close'].values >= df['open'].values, 'green', 'red')
+    ax.vlines(dates, df['low'].values, df['high'].values, colors='black', linewidth=0.5)  # Wicks
+    ax.vlines(dates, df['open'].values, df['close'].values, colors=colors, linewidth=6, capstyle='projecting')  # Body
 
     # Plot indicators
-    ax.plot(df.index, df['sma_5'], label="SMA 5", color="blue", linewidth=1.5)
-    ax.plot(df.index, df['bbl'], label="BBL", color="green", linewidth=1, linestyle='--')
-    ax.plot(df.index, df['bbu'], label="BBU", color="yellow", linewidth=1, linestyle='--')
+    ax.plot(dates, sma_5, label="SMA 5", color="blue", linewidth=1.5)
+    ax.plot(dates, bbl, label="BBL", color="green", linewidth=1, linestyle='--')
+    ax.plot(dates, bbu, label="BBU", color="yellow", linewidth=1, linestyle='--')
 
     # highlight current date
     if now_date in df.index:
@@ -45,86 +75,150 @@ def plot_kline(df, title, save_path, now_date, mode="train"):
     ax.set_xlabel("Date", fontsize=12)
     ax.set_ylabel("Price", fontsize=12)
 
-    # Format date axis
+    # Format date axis, at most about a dozen labelled days
+    ax.xaxis.set_major_locator(DayLocator(interval=max(1, int(np.ceil(len(df) / 12)))))
     ax.xaxis.set_major_formatter(DateFormatter('%Y-%m-%d'))
     fig.autofmt_xdate()
 
     # Add legend
     ax.legend()
 
+    # Fixed margins instead of tight_layout, which measures every text artist
+    fig.subplots_adjust(left=0.08, right=0.98, bottom=0.14, top=0.93)
+
+    data = encode_canvas(canvas, image_format)
+
     # Save the figure
-    print("saving")
-    plt.tight_layout()
-    plt.savefig(save_path, dpi=300)
-    plt.close()
+    if save_path is not None:
+        with open(save_path, "wb") as f:
+            f.write(data)
+
+    return data
+
+class TradingChart():
+    '''Price and cumulative return chart of a run that grows one step at a time.
+
+    The two-panel figure is created once; each step only appends its point to the
+    price and return series and the BUY/SELL markers are drawn by one scatter
+    collection per action. A render then updates the artists in place instead of
+    rebuilding the figure, so per-step charts cost the same however long the run is.
+    '''
+
+    def __init__(self, width=3.5, opacity=0.8, figsize=(10, 8), dpi=100):
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax1, self.ax2 = self.fig.subplots(2, 1, gridspec_kw={'height_ratios': [4, 3]})
+
+        self.dates = []
+        self.prices = []
+        self.returns = []
+        self.buys = []
+        self.sells = []
+
+        # --- Plot 1: Adjusted Close Prices ---
+        self.price_line, = self.ax1.plot([], [], linewidth=width, alpha=opacity, label="Adj Close Prices")
+        self.buy_markers = self.ax1.scatter([], [], s=100, marker='D', color='green', zorder=5, label='BUY')
+        self.sell_markers = self.ax1.scatter([], [], s=150, marker='P', color='red', zorder=5, label='SELL')
+        self.now_marker = self.ax1.scatter([], [], s=120, marker='P', color='grey', zorder=5)
+        self.ax1.set_ylabel("Price")
+        self.ax1.grid(True)
+
+        # --- Plot 2: Cumulative Returns ---
+        self.return_line, = self.ax2.plot([], [], linewidth=width, alpha=opacity, label="Cumulative Returns")
+        self.ax2.set_ylabel("Cumulative Returns (%)")
+        self.ax2.grid(True)
+        # Append a percent sign to y-axis tick labels
+        self.ax2.yaxis.set_major_formatter(mtick.FuncFormatter(lambda x, pos: f'{x}%'))
+        self.ax2.legend(loc='best')
+
+        for ax in (self.ax1, self.ax2):
+            ax.xaxis.set_major_formatter(DateFormatter('%Y-%m-%d'))
+            ax.tick_params(axis='x', labelrotation=45)
+
+        # Fixed margins instead of tight_layout, which measures every text artist
+        self.fig.subplots_adjust(left=0.1, right=0.97, bottom=0.1, top=0.97, hspace=0.45)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def extend(self, dates, prices, actions, returns):
+        '''Appends the points of one or more steps: their dates, closing prices, actions and the cumulative returns after them.'''
+        x = date2num(pd.to_datetime(list(dates)))
+        prices = np.asarray(prices, dtype=float)
+        actions = np.asarray(actions, dtype=object)
+
+        self.dates.extend(x)
+        self.prices.extend(prices)
+        self.returns.extend(np.asarray(returns, dtype=float))
+        self.buys.extend(zip(x[actions == 'BUY'], prices[actions == 'BUY']))
+        self.sells.extend(zip(x[actions == 'SELL'], prices[actions == 'SELL']))
+
+    def render(self, now_date=None, image_format="png"):
+        '''Draws the chart with the points appended so far and returns the encoded image bytes.'''
+        self.price_line.set_data(self.dates, self.prices)
+        self.return_line.set_data(self.dates, self.returns)
+
+        # Determine y-axis limits based on the closing prices
+        min_y = min(self.prices)
+        max_y = max(self.prices)
+        delta = max_y - min_y
+        lowerbound = round(min_y - delta * 0.1, 2)
+        upperbound = round(max_y + delta * 0.1, 2)
+        if delta > 5:
+            lowerbound = int(lowerbound)
+            upperbound = int(upperbound)
+        if lowerbound < upperbound:
+            self.ax1.set_ylim(lowerbound, upperbound)
+
+        # BUY markers sit a little below the price, which depends on the price range so far
+        buys = np.array(self.buys, dtype=float).reshape(-1, 2)
+        buys[:, 1] -= delta * 0.08
+        self.buy_markers.set_offsets(buys)
+        self.sell_markers.set_offsets(np.array(self.sells, dtype=float).reshape(-1, 2))
+
+        # Optionally, mark the "now_date" if it is one of the points
+        now = np.empty((0, 2))
+        if now_date is not None:
+            x_now = date2num(pd.to_datetime(now_date))
+            if x_now in self.dates:
+                now = np.array([[x_now, self.prices[self.dates.index(x_now)]]])
+        self.now_marker.set_offsets(now)
+        self.now_marker.set_label(f'Now: {now_date}' if len(now) else '_nolegend_')
+
+        x_min, x_max = self.dates[0], self.dates[-1]
+        if x_min == x_max:
+            x_min, x_max = x_min - 1, x_max + 1
+        for ax in (self.ax1, self.ax2):
+            ax.set_xlim(x_min, x_max)
+            # At most about a dozen labelled days
+            ax.xaxis.set_major_locator(DayLocator(interval=max(1, int(np.ceil((x_max - x_min) / 12)))))
+        self.ax2.relim()
+        self.ax2.autoscale_view(scalex=False)
+
+        handles = [self.price_line] + [markers for markers in (self.buy_markers, self.sell_markers, self.now_marker)
+                                       if len(markers.get_offsets()) > 0]
+        self.ax1.legend(handles=handles, loc='best')
+
+        return encode_canvas(self.canvas, image_format)
+
 
 def plot_trading(data, save_path, now_date=None, width=3.5, opacity=0.8, path=None):
+    '''Draws the trading chart of a whole record dict at once, see TradingChart for per-step charts.'''
     # Extract data (using all but the last entry for dates, prices, actions;
     # returns are shifted by one)
-    print(data)
-    dates = data['date'][:-1]
-    closing_prices = data['price'][:-1]
-    returns = data['total_profit'][1:]
-    actions = data['action'][:-1]
-
-    # Determine y-axis limits based on the closing prices
-    min_y = min(closing_prices)
-    max_y = max(closing_prices)
-    delta = max_y - min_y
-    lowerbound = round(min_y - delta * 0.1, 2)
-    upperbound = round(max_y + delta * 0.1, 2)
-    if delta > 5:
-        lowerbound = int(lowerbound)
-        upperbound = int(upperbound)
-
-    # Create a figure with two vertically stacked subplots.
-    # Height ratios roughly mimic the original 40%/35% split.
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), gridspec_kw={'height_ratios': [4, 3]})
-
-    # --- Plot 1: Adjusted Close Prices ---
-    ax1.plot(dates, closing_prices, linewidth=width, alpha=opacity, label="Adj Close Prices")
-    ax1.set_ylim(lowerbound, upperbound)
-    ax1.set_ylabel("Price")
-    ax1.grid(True)
-
-    # Add markers for BUY and SELL actions
-    # We subtract a little from the price for BUY markers so they appear slightly lower.
-    buy_plotted = False
-    sell_plotted = False
-    for d, p, a in zip(dates, closing_prices, actions):
-        if a == 'BUY':
-            ax1.scatter(d, p - delta * 0.08, s=100, marker='D', color='green', zorder=5,
-                        label='BUY' if not buy_plotted else "")
-            buy_plotted = True
-        elif a == 'SELL':
-            ax1.scatter(d, p, s=150, marker='P', color='red', zorder=5,
-                        label='SELL' if not sell_plotted else "")
-            sell_plotted = True
-
-    # Optionally, mark the "now_date" if provided
-    if now_date is not None and now_date in dates:
-        idx = dates.index(now_date)
-        p_now = closing_prices[idx]
-        ax1.scatter(now_date, p_now, s=120, marker='P', color='grey', zorder=5,
-                    label=f'Now: {now_date}')
-
-    ax1.legend(loc='best')
-    # Rotate x-axis labels for readability
-    plt.setp(ax1.get_xticklabels(), rotation=45, ha='right')
-
-    # --- Plot 2: Cumulative Returns ---
-    ax2.plot(dates, returns, linewidth=width, alpha=opacity, label="Cumulative Returns")
-    ax2.set_ylabel("Cumulative Returns (%)")
-    ax2.grid(True)
-    # Append a percent sign to y-axis tick labels
-    ax2.yaxis.set_major_formatter(mtick.FuncFormatter(lambda x, pos: f'{x}%'))
-    plt.setp(ax2.get_xticklabels(), rotation=45, ha='right')
-    ax2.legend(loc='best')
-
-    plt.tight_layout()
+    chart = TradingChart(width=width, opacity=opacity)
+    chart.extend(data['date'][:-1],
+                 data['price'][:-1],
+                 data['action'][:-1],
+                 data['total_profit'][1:])
+
+    image_format = os.path.splitext(save_path)[1].lstrip('.').lower() or "png"
+    data = chart.render(now_date=now_date,
+                        image_format="jpeg" if image_format == "jpg" else image_format)
+
     # Save the figure to the specified path
-    plt.savefig(save_path)
-    plt.close(fig)
+    with open(save_path, "wb") as f:
+        f.write(data)
 
 
 if __name__ == "__main__":
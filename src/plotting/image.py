@@ -0,0 +1,61 @@
+import base64
+import os
+
+# Image formats accepted by matplotlib's savefig mapped to their MIME types
+IMAGE_MIME_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+}
+
+class ChartImage():
+    '''An encoded chart held in memory.
+
+    Charts are rendered straight into bytes so vision prompts can embed them without a
+    round trip through the file system. `path` is where the chart is (or will be)
+    persisted, or None if it is only kept in memory.
+    '''
+
+    def __init__(self,
+                 data: bytes,
+                 image_format: str = "png",
+                 path: str = None) -> None:
+        '''
+        :param data: Encoded image bytes.
+        :param image_format: Encoding of the bytes, "png" or "jpeg".
+        :param path: File the image is persisted to, if any.
+        '''
+        if image_format not in IMAGE_MIME_TYPES:
+            raise ValueError(f"Unsupported image format {image_format}, expected one of {list(IMAGE_MIME_TYPES)}")
+
+        self.data = data
+        self.image_format = image_format
+        self.path = path
+
+    @property
+    def mime_type(self) -> str:
+        return IMAGE_MIME_TYPES[self.image_format]
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode('utf-8')
+
+    def data_url(self) -> str:
+        '''Data URL of the image, as expected by the image_url content of vision models.'''
+        return f"data:{self.mime_type};base64,{self.to_base64()}"
+
+    def save(self, path: str = None) -> str:
+        '''
+        Writes the image to disk.
+
+        :param path: Target file. Defaults to the image's own path.
+        :return: The path written to.
+        '''
+        path = path if path is not None else self.path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial image
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.data)
+        os.replace(tmp_path, path)
+        return path
@@ -1,9 +1,15 @@
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Iterable
 
 import pandas as pd
 
 from src.registry import PLOTS
-from src.plotting.charts import plot_kline, plot_trading
+from src.plotting.charts import plot_kline, TradingChart
+from src.plotting.image import ChartImage
+from src.plotting.cache import ChartCache, chart_key
 from src.utils.file_utils import init_path
 import shutil
 
@@ -13,53 +19,274 @@ class PlotsInterface():
                  root = None,
                  workdir = None,
                  tag = None,
-                 suffix = 'png') -> None:
+                 suffix = 'png',
+                 dpi = 300,
+                 figsize = (12, 8),
+                 save_images = True,
+                 async_save = True,
+                 render_workers = 2,
+                 prerender_window = 8,
+                 cache_size_mb = 256,
+                 cache_dir = None) -> None:
+        """
+        Args:
+            root (str): Project root.
+            workdir (str): Work directory under the root.
+            tag (str): Experiment tag, plots are stored under <root>/<workdir>/<tag>/plots.
+            suffix (str): Image format of the kline charts, "png" or "jpeg".
+            dpi (int): Resolution the kline charts are rendered at.
+            figsize (tuple): Size of the kline charts in inches.
+            save_images (bool): Whether in-memory kline charts are also written to disk.
+            async_save (bool): Write in-memory kline charts to disk on a background thread.
+            render_workers (int): Threads of the pool kline charts are rendered on by submit_kline and prerender_klines.
+            prerender_window (int): Number of days prerender_klines keeps rendered or queued ahead of the run.
+            cache_size_mb (float): Size cap of the kline chart cache, 0 or None disables the cache.
+            cache_dir (str): Directory of the kline chart cache, defaults to <plots>/cache. Point it outside the experiment to share it between experiments.
+        """
         super(PlotsInterface, self).__init__()
         self.root = root
         self.workdir = workdir
         self.tag = tag
         self.suffix = suffix
+        self.image_format = "jpeg" if suffix in ["jpg", "jpeg"] else suffix
+        self.dpi = dpi
+        self.figsize = tuple(figsize)
+        self.save_images = save_images
+        self.async_save = async_save
 
         self.exp_path = init_path(os.path.join(self.root, self.workdir, self.tag))
         self.plot_path = init_path(os.path.join(self.exp_path, "plots"))
         self.kline_plot_path = init_path(os.path.join(self.plot_path, "kline"))
         self.trading_plot_path = init_path(os.path.join(self.plot_path, "trading"))
 
-    def plot_kline(self, state, info, save_dir, mode = "train"):
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plot-writer") if async_save else None
+        self.pending_writes = []
+        self.pending_writes_lock = threading.Lock()
 
-        try:
-            price = state["price"]
+        # Kline charts are drawn without pyplot, so they can be rendered on plain threads
+        self.renderer = ThreadPoolExecutor(max_workers=max(int(render_workers), 1), thread_name_prefix="plot-render")
+        self.prerender_window = max(int(prerender_window), 1)
+        self.prerendered = {}
+        self.prerender_queues = {}
+        self.prerendered_lock = threading.Lock()
+
+        # Incremental trading charts, one per save_dir
+        self.trading_charts = {}
+        self.trading_lock = threading.Lock()
+
+        # Charts of identical windows are reused instead of drawn again, e.g. when re-running a range
+        self.cache = None
+        if cache_size_mb:
+            self.cache = ChartCache(cache_dir if cache_dir is not None else os.path.join(self.plot_path, "cache"),
+                                    max_bytes=int(cache_size_mb * 1024 * 1024))
+
+    def _prepare_kline(self, state, info, save_dir):
+        price = state["price"]
 
-            kline_dir = init_path(os.path.join(self.kline_plot_path, save_dir))
+        kline_dir = init_path(os.path.join(self.kline_plot_path, save_dir))
 
-            price = price[["open", "high", "low", "close", "volume"]]
-            price = price.reset_index(drop=False)
-            price = price.dropna(axis=0, how="any")
-            price = price.drop_duplicates(subset=["timestamp"], keep="first")
-            price = price.set_index("timestamp")
+        price = price[["open", "high", "low", "close", "volume"]]
+        price = price.reset_index(drop=False)
+        price = price.dropna(axis=0, how="any")
+        price = price.drop_duplicates(subset=["timestamp"], keep="first")
+        price = price.set_index("timestamp")
+
+        title = "{} kline of {}".format(info["date"], info["symbol"])
+        kline_path = os.path.join(kline_dir, "kline_{}.{}".format(info["date"], self.suffix))
+
+        now_date = pd.to_datetime(info["date"])
+        now_date = min(price.index, key=lambda x: abs(x - now_date)) # find the nearest date before now_date
+        now_date = now_date.strftime("%Y-%m-%d")
+
+        return price, title, kline_path, now_date, state.get("indicators")
+
+    def _draw_kline(self, price, title, now_date, mode, indicators):
+        key = None
+        if self.cache is not None:
+            key = chart_key(price,
+                            indicators,
+                            title=title,
+                            now_date=now_date,
+                            mode=mode,
+                            dpi=self.dpi,
+                            figsize=self.figsize,
+                            image_format=self.image_format)
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+
+        data = plot_kline(price,
+                          title,
+                          None,
+                          now_date=now_date,
+                          mode=mode,
+                          dpi=self.dpi,
+                          figsize=self.figsize,
+                          image_format=self.image_format,
+                          indicators=indicators)
+
+        if key is not None:
+            self.cache.put(key, data, suffix=self.suffix)
+        return data
+
+    @staticmethod
+    def _save_image(image):
+        # Charts served from the cache are usually already on disk from an earlier run
+        try:
+            with open(image.path, "rb") as f:
+                if f.read() == image.data:
+                    return image.path
+        except OSError:
+            pass
+        return image.save()
 
-            title = "{} kline of {}".format(info["date"], info["symbol"])
-            kline_path = os.path.join(kline_dir, "kline_{}.{}".format(info["date"], self.suffix))
+    def plot_kline(self, state, info, save_dir, mode = "train"):
+        """
+        Draws the kline chart of a day and saves it to a file.
 
-            now_date = pd.to_datetime(info["date"])
-            now_date = min(price.index, key=lambda x: abs(x - now_date)) # find the nearest date before now_date
-            now_date = now_date.strftime("%Y-%m-%d")
+        Returns:
+            str or None: The file path of the saved chart, or None if an error occurred.
+        """
+        try:
+            price, title, kline_path, now_date, indicators = self._prepare_kline(state, info, save_dir)
 
-            plot_kline(price,
-                       title,
-                       kline_path,
-                       now_date=now_date,
-                       mode=mode)
+            data = self._draw_kline(price, title, now_date, mode, indicators)
+            self._save_image(ChartImage(data, image_format=self.image_format, path=kline_path))
 
         except Exception as e:
             print(e)
             kline_path = None
         return kline_path
-    
+
+    def render_kline(self, state, info, save_dir, mode = "train"):
+        """
+        Draws the kline chart of a day in memory.
+
+        With save_images set the chart is also persisted to its kline path, in the background if async_save is set.
+        A chart pre-rendered by prerender_klines is handed out instead of being drawn again.
+
+        Returns:
+            ChartImage or None: The encoded chart, or None if an error occurred.
+        """
+        with self.prerendered_lock:
+            future = self.prerendered.pop((save_dir, mode, info["date"]), None)
+        if future is not None:
+            self._fill_prerender_window(save_dir, mode)
+            try:
+                image = future.result()
+            except Exception as e:
+                print(f"Error pre-rendering kline chart: {e}")
+                image = None
+            if image is not None:
+                return image
+
+        return self._render_kline(state, info, save_dir, mode)
+
+    def _render_kline(self, state, info, save_dir, mode = "train"):
+        try:
+            price, title, kline_path, now_date, indicators = self._prepare_kline(state, info, save_dir)
+
+            data = self._draw_kline(price, title, now_date, mode, indicators)
+
+            image = ChartImage(data,
+                               image_format=self.image_format,
+                               path=kline_path if self.save_images else None)
+
+        except Exception as e:
+            print(e)
+            return None
+
+        if image.path is not None:
+            if self.writer is not None:
+                with self.pending_writes_lock:
+                    self.pending_writes = [future for future in self.pending_writes if not future.done()]
+                    self.pending_writes.append(self.writer.submit(self._save_image, image))
+            else:
+                self._save_image(image)
+
+        return image
+
+    def submit_kline(self, state, info, save_dir, mode = "train", in_memory = True) -> Future:
+        """
+        Draws the kline chart of a day on the render pool.
+
+        Args:
+            in_memory (bool): Resolve to the encoded chart like render_kline, or to its file path like plot_kline.
+
+        Returns:
+            Future: Resolves to a ChartImage or a file path, or None if an error occurred.
+        """
+        if in_memory:
+            return self.renderer.submit(self._render_kline, state, info, save_dir, mode)
+        return self.renderer.submit(self.plot_kline, state, info, save_dir, mode)
+
+    def prerender_klines(self, env, save_dir, mode = "train", days: Iterable[int] = None) -> None:
+        """
+        Renders the kline charts of a backtest range ahead of the run on the render pool.
+
+        At most prerender_window charts are rendered or queued at a time. Each chart is picked
+        up by render_kline when the run reaches its day, which queues the next day of the range,
+        so the run only waits for a chart if the pool has not caught up with it yet.
+
+        Args:
+            env (TradingEnvironment): Environment the states of the days are taken from.
+            save_dir (str): Subdirectory the charts are saved to.
+            mode (str): Run mode, see plot_kline.
+            days (Iterable[int]): Day indices to render, in the order the run reaches them. Defaults to every day of the environment.
+        """
+        if days is None:
+            days = range(env.init_day, env.end_day + 1)
+
+        with self.prerendered_lock:
+            self.prerender_queues[(save_dir, mode)] = (env, deque(days))
+        self._fill_prerender_window(save_dir, mode)
+
+    def _fill_prerender_window(self, save_dir, mode):
+        with self.prerendered_lock:
+            if (save_dir, mode) not in self.prerender_queues:
+                return
+            env, days = self.prerender_queues[(save_dir, mode)]
+
+            queued = sum(1 for key in self.prerendered if key[:2] == (save_dir, mode))
+            while len(days) > 0 and queued < self.prerender_window:
+                day = days.popleft()
+                info = {
+                    "symbol": str(env.symbol),
+                    "date": env.get_current_date(day=day).strftime('%Y-%m-%d'),
+                }
+                self.prerendered[(save_dir, mode, info["date"])] = self.renderer.submit(self._render_day, env, day, info, save_dir, mode)
+                queued += 1
+
+            if len(days) == 0:
+                del self.prerender_queues[(save_dir, mode)]
+
+    def _render_day(self, env, day, info, save_dir, mode):
+        return self._render_kline(env.get_state(day=day), info, save_dir, mode)
+
+    def flush(self):
+        """Waits until all queued charts are rendered and on disk, pre-rendered charts that were never used are dropped."""
+        with self.prerendered_lock:
+            prerendered, self.prerendered = self.prerendered, {}
+            self.prerender_queues = {}
+        for future in prerendered.values():
+            if not future.cancel():
+                future.exception()
+
+        with self.pending_writes_lock:
+            pending_writes, self.pending_writes = self.pending_writes, []
+        for future in pending_writes:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error saving chart: {e}")
+
     def plot_trading(self, records, info, save_dir):
         """
-        Generates a trading plot using matplotlib and saves it to a file.
-        
+        Draws the trading chart of a run so far and saves it to a file.
+
+        The chart of each save_dir is kept between calls and only the records added since
+        the previous call are appended to it, so the cost does not grow with the run.
+
         Args:
             records (dict): A dictionary of trading records.
             info (dict): Dictionary with at least a 'date' key.
@@ -75,11 +302,29 @@ class PlotsInterface():
             # Construct the filename, e.g. "trading_2020-01-01.png"
             trading_path = os.path.join(trading_dir, "trading_{}.{}".format(info['date'], self.suffix))
 
-            # Plot trading chart
-            plot_trading(records, trading_path, now_date=info.get('date'))
+            # The last record has no return after it yet, see plot_trading in charts
+            num_points = len(records['date']) - 1
+            if num_points <= 0:
+                return None
+
+            with self.trading_lock:
+                chart = self.trading_charts.get(save_dir)
+                if chart is None or len(chart) > num_points:
+                    # First chart of this save_dir or the records were reset
+                    chart = TradingChart()
+                    self.trading_charts[save_dir] = chart
+
+                start = len(chart)
+                chart.extend(records['date'][start:num_points],
+                             records['price'][start:num_points],
+                             records['action'][start:num_points],
+                             records['total_profit'][start + 1:num_points + 1])
+                data = chart.render(now_date=info.get('date'), image_format=self.image_format)
+
+            ChartImage(data, image_format=self.image_format, path=trading_path).save()
             
         except Exception as e:
             print(f"Error in plot_trading: {e}")
             trading_path = None
 
-        return trading_path
\ No newline at end of file
+        return trading_path
@@ -1,6 +1,5 @@
 import os
 import math
-from copy import deepcopy
 from pathlib import Path
 from typing import Dict, Any
 
@@ -8,6 +7,8 @@ from src.query.query_types import extract_query_type
 from src.query.diverse_query import DiverseQuery
 from src.memory import MemoryInterface
 from src.provider import EmbeddingProvider
+from src.prompt.packing import TokenBudgetPacker
+from src.pipeline import LayeredParams
 ROOT = str(Path(__file__).resolve().parents[2])
 
 def prepare_latest_market_intelligence_params(state: Dict,
@@ -15,14 +16,17 @@ def prepare_latest_market_intelligence_params(state: Dict,
                                             params: Dict,
                                             memory: MemoryInterface = None,
                                             provider: EmbeddingProvider = None,
-                                            diverse_query: DiverseQuery = None
+                                            diverse_query: DiverseQuery = None,
+                                            token_budget: int = None,
+                                            item_max_tokens: int = None,
                                             ):
 
-    res_params = deepcopy(params)
+    res_params = LayeredParams.over(params)
 
     latest_market_intelligence_query = params["latest_market_intelligence_query"]
 
     query_res = {}
+    query_rank = {}
     for query_type, quey_text in latest_market_intelligence_query.items():
 
         if len(quey_text) == 0 or len(quey_text.split(" ")) <= 5:
@@ -39,22 +43,27 @@ def prepare_latest_market_intelligence_params(state: Dict,
                                           query_types=[query_type],
                                           top_k=3)[query_type]["query_items"]
 
-        for item in query_items:
+        for rank, item in enumerate(query_items):
             id = item["id"]
             if id not in query_res:
                 query_res[id] = item
+            query_rank[id] = min(rank, query_rank.get(id, rank))
 
     query_res = sorted(query_res.items(), key=lambda x: x[0], reverse=False)
     query_res = [item[1] for item in query_res]
 
     print(f"Number of queried past market intelligence: {len(query_res)}")
 
+    packer = TokenBudgetPacker(provider=provider,
+                               token_budget=token_budget)
+
     past_market_intelligence_list = []
+    past_market_intelligence_rank = []
     for item in query_res:
         date = item["date"] if isinstance(item["date"], str) else item["date"].strftime("%Y-%m-%d")
         id = item["id"]
         title = item["title"]
-        text = item["text"]
+        text = packer.truncate(item["text"], item_max_tokens)
         open = item["open"]
         high = item["high"]
         low = item["low"]
@@ -72,6 +81,11 @@ def prepare_latest_market_intelligence_params(state: Dict,
             past_market_intelligence_query_item += f"Prices: Today is closed for trading.\n"
 
         past_market_intelligence_list.append(past_market_intelligence_query_item)
+        past_market_intelligence_rank.append(query_rank[id])
+
+    # Keep the best ranked retrievals when the budget is tight
+    past_market_intelligence_list = packer.pack(past_market_intelligence_list,
+                                                priorities=past_market_intelligence_rank)
 
     if len(past_market_intelligence_list) == 0:
         past_market_intelligence_text = "There is no past market_intelligence.\n"
@@ -92,7 +106,7 @@ def prepare_low_level_reflection_params(state: Dict,
                                         diverse_query: DiverseQuery = None
                                         ):
     
-    llr_params = deepcopy(params)
+    llr_params = LayeredParams.over(params)
 
     low_level_reflection_query = params["low_level_reflection_query"]
     low_level_reflection_reasoning = params["low_level_reflection_reasoning"]
@@ -0,0 +1,85 @@
+from typing import List, Optional, Sequence
+
+from src.provider import LLMProvider
+
+def count_tokens(provider: Optional[LLMProvider], text: str) -> int:
+    '''Counts tokens with the provider tokenizer, or estimates them if the provider has none.'''
+    if provider is not None and hasattr(provider, "count_tokens"):
+        return provider.count_tokens(text)
+    return (len(text) + 3) // 4
+
+def truncate_to_tokens(provider: Optional[LLMProvider], text: str, max_tokens: Optional[int]) -> str:
+    '''Cuts a text down to max_tokens tokens. A max_tokens of None leaves the text unchanged.'''
+    if max_tokens is None:
+        return text
+    if provider is not None and hasattr(provider, "truncate_to_tokens"):
+        return provider.truncate_to_tokens(text, max_tokens)
+    return text[:max_tokens * 4]
+
+class TokenBudgetPacker():
+    '''Fills a prompt section with as many items as fit into a token budget.
+
+    Items are admitted in priority order (lower value first) until the budget is spent,
+    then returned in their original order so the prompt keeps its chronological layout.
+    Items that do not fit are skipped rather than truncated, so a single long item can
+    not crowd out the rest; long fields should be cut with `truncate` beforehand.
+    '''
+
+    def __init__(self,
+                 provider: Optional[LLMProvider] = None,
+                 token_budget: Optional[int] = None,
+                 max_items: Optional[int] = None,
+                 separator: str = "\n") -> None:
+        '''
+        :param provider: Provider whose tokenizer is used to count tokens.
+        :param token_budget: Maximum number of tokens of the packed section. None disables the limit.
+        :param max_items: Maximum number of items to pack. None disables the limit.
+        :param separator: String placed between items when they are joined.
+        '''
+        self.provider = provider
+        self.token_budget = token_budget
+        self.max_items = max_items
+        self.separator = separator
+
+    def truncate(self, text: str, max_tokens: Optional[int]) -> str:
+        '''Cuts a single field down to max_tokens tokens.'''
+        return truncate_to_tokens(self.provider, text, max_tokens)
+
+    def select(self,
+               items: Sequence[str],
+               priorities: Optional[Sequence[float]] = None) -> List[int]:
+        '''
+        Chooses which items to keep.
+
+        :param items: Rendered items.
+        :param priorities: One priority per item, lower values are packed first. Defaults to item order.
+        :return: Indices of the kept items in their original order.
+        '''
+        if priorities is None:
+            priorities = range(len(items))
+        order = sorted(range(len(items)), key=lambda i: priorities[i])
+
+        separator_tokens = count_tokens(self.provider, self.separator)
+        used_tokens = 0
+        selected = []
+        for i in order:
+            if self.max_items is not None and len(selected) >= self.max_items:
+                break
+
+            item_tokens = count_tokens(self.provider, items[i])
+            if len(selected) > 0:
+                item_tokens += separator_tokens
+
+            if self.token_budget is not None and used_tokens + item_tokens > self.token_budget:
+                continue
+
+            used_tokens += item_tokens
+            selected.append(i)
+
+        return sorted(selected)
+
+    def pack(self,
+             items: Sequence[str],
+             priorities: Optional[Sequence[float]] = None) -> List[str]:
+        '''Returns the items that fit into the budget, in their original order.'''
+        return [items[i] for i in self.select(items, priorities)]
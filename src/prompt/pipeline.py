@@ -0,0 +1,53 @@
+from typing import Any, Dict, List
+
+from src.registry import PROMPT
+
+class PromptPipeline():
+    '''The prompts of a trading step, built once per run and mode.
+
+    Building a prompt reads and parses its YAML template, so the prompts are built up
+    front and reused for every step; a step then only renders them. The template of
+    each prompt is taken from `<mode>_<name>_template_path` in the config without
+    writing it back into the prompt config.
+    '''
+
+    def __init__(self,
+                 cfg: Any,
+                 mode: str = "train",
+                 names: List[str] = None) -> None:
+        '''
+        :param cfg: Experiment config with one prompt config and two template paths per prompt.
+        :param mode: Run mode, "train" uses the train templates and anything else the valid templates.
+        :param names: Names of the prompts to build. Defaults to all prompts of a step.
+        '''
+        if names is None:
+            names = [
+                "latest_market_intelligence_summary",
+                "past_market_intelligence_summary",
+                "low_level_reflection",
+                "decision",
+            ]
+
+        self.mode = mode
+        template_mode = "train" if mode == "train" else "valid"
+
+        self.prompts = dict()
+        for name in names:
+            prompt_cfg = dict(cfg[name])
+            prompt_cfg["template_path"] = cfg[f"{template_mode}_{name}_template_path"]
+            self.prompts[name] = PROMPT.build(prompt_cfg)
+
+    def __getitem__(self, name: str) -> Any:
+        return self.prompts[name]
+
+    def prepare_params(self,
+                       state: Dict,
+                       info: Dict,
+                       provider: Any = None) -> Dict:
+        '''Collects the params every prompt can prepare ahead of time, see YamlPrompt.prepare_params.'''
+        params = dict()
+        for prompt in self.prompts.values():
+            params.update(prompt.prepare_params(state=state,
+                                                info=info,
+                                                provider=provider))
+        return params
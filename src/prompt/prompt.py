@@ -1,19 +1,64 @@
 import json
 import os
+import time
 import backoff
 import yaml
 import re
 import abc
 from copy import deepcopy
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 from jinja2 import Environment, BaseLoader, Template, exceptions as jinja2_exceptions
 
 from src.registry import PROMPT
 from src.memory import MemoryInterface
 from src.asset import ASSET
-from src.provider.provider import encode_image
+from src.provider.provider import image_data_url
 from src.utils.file_utils import read_resource_file
 
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+ID_LINE_PATTERN = re.compile(r"(ID:\s\d+\s-\s)(.*)")
+YAML_BLOCK_PATTERN = re.compile(r'```yaml\s*\n(.*?)```', flags=re.DOTALL | re.IGNORECASE)
+
+JINJA_ENV = Environment(loader=BaseLoader())
+
+# Compiled templates kept per process, least recently used ones are dropped beyond this
+TEMPLATE_CACHE_SIZE = 256
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(template_str: str) -> Template:
+    '''
+    Compiles a Jinja template once per process.
+
+    :param template_str: Template source, also the cache key.
+    :return: Compiled template.
+    '''
+    try:
+        return JINJA_ENV.from_string(template_str)
+    except jinja2_exceptions.TemplateError as e:
+        raise ValueError(f"Error compiling template: {e}")
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def get_task_prompt_template(name: str) -> Template:
+    '''
+    Compiled task prompt snippet, cached by name so the snippet is neither copied out of ASSET nor parsed again.
+
+    :param name: Name of the task prompt.
+    :return: Compiled template.
+    '''
+    return compile_template(ASSET.get_task_prompts(name=name))
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def get_image_task_prompt(name: str) -> Tuple[str, str]:
+    '''
+    Image task prompt snippet with the name of the path placeholder it contains.
+
+    :param name: Name of the image task prompt.
+    :return: Tuple of the snippet and its placeholder name.
+    '''
+    image_content = ASSET.get_task_prompts(name=name)
+    return image_content, PLACEHOLDER_PATTERN.findall(image_content)[0]
+
 @PROMPT.register_module(force=True)
 class YamlPrompt():
     '''General prompt class for all prompt templates in YAML format.'''
@@ -27,7 +72,8 @@ class YamlPrompt():
         """
         self.template_path = template_path
         self.template = self._load_template()
-        self.env = Environment(loader=BaseLoader())
+        self.env = JINJA_ENV
+        self.placeholder_plan = self._get_placeholder_plan()
         
     def _load_template(self) -> Dict[str, Any]:
         '''
@@ -53,26 +99,40 @@ class YamlPrompt():
 
         :return: Dict of placeholder names for each role.
         """
-        import re
         placeholders = dict()
-        pattern = re.compile(r"\{\{\s*(\w+)\s*\}\}")
         for message in self.template['messages']:
             placeholds = list()
             role = message.get('role', '')
             content = message.get('content', '')
-            matches = pattern.findall(content)
+            matches = PLACEHOLDER_PATTERN.findall(content)
             placeholds.append(matches)
             placeholders[role] = placeholds
         return placeholders
     
+    def _get_placeholder_plan(self) -> Dict[str, List[Tuple[str, bool, Optional[str]]]]:
+        """
+        Resolves once how each placeholder of the template is filled.
+
+        :return: Dict with, for each role, a list of (placeholder, is_task_prompt, image_task_prompt) tuples,
+                 where image_task_prompt is the name of the placeholder's image sub-prompt or None.
+        """
+        plan = dict()
+        for role, placeholder_lists in self._get_placeholders().items():
+            plan[role] = []
+            for placeholder_list in placeholder_lists:
+                for placeholder in placeholder_list:
+                    potential_image_name = placeholder + "image"
+                    plan[role].append((placeholder,
+                                       ASSET.check_task_prompts(name=placeholder),
+                                       potential_image_name if ASSET.check_task_prompts(name=potential_image_name) else None))
+        return plan
+    
     def _get_path_placeholder(self, text) -> str:
         '''
         Extracts the image path placeholder from the given text.
         :return: String containing the placeholder text
         '''
-        import re
-        pattern = re.compile(r"\{\{\s*(\w+)\s*\}\}")
-        image_path_placeholder = pattern.findall(text)
+        image_path_placeholder = PLACEHOLDER_PATTERN.findall(text)
         return image_path_placeholder[0]
     
     def render_template(self, template_str: str, params: Dict[str, Any]) -> str:
@@ -83,8 +143,20 @@ class YamlPrompt():
         :param params: Dictionary containing values to replace placeholders.
         :return: Rendered string.
         """
+        return self._render(compile_template(template_str), params)
+    
+    def render_task_prompt(self, name: str, params: Dict[str, Any]) -> str:
+        """
+        Renders a task prompt snippet from the compiled template cache.
+
+        :param name: Name of the task prompt.
+        :param params: Dictionary containing values to replace placeholders.
+        :return: Rendered string.
+        """
+        return self._render(get_task_prompt_template(name), params)
+    
+    def _render(self, template: Template, params: Dict[str, Any]) -> str:
         try:
-            template = self.env.from_string(template_str)
             rendered = template.render(**params).strip()
             return rendered
         except jinja2_exceptions.TemplateError as e:
@@ -95,10 +167,24 @@ class YamlPrompt():
                            **kwargs) -> Dict:
         raise NotImplementedError
     
+    def prepare_params(self,
+                       state: Dict,
+                       info: Dict,
+                       provider: Any = None) -> Dict:
+        '''
+        Computes the params that only depend on the day's data and not on the other prompts of the step,
+        so they can be prepared ahead of time. Params already present are not computed again.
+
+        :param state: State of the day.
+        :param info: Info of the day, at least its date and symbol.
+        :param provider: Provider whose tokenizer is used when rendering.
+        :return: Dictionary of prepared params.
+        '''
+        return {}
+    
     def _preprocess_yaml_output(self,
                                 response):
-        processed_response = re.sub(
-            r"(ID:\s\d+\s-\s)(.*)",  # Match 'ID:', the ID number, and the rest of the line
+        processed_response = ID_LINE_PATTERN.sub(
             r'\1"\2"',              # Keep 'ID:' and ID number, but wrap the rest in quotes
             response
         )
@@ -112,29 +198,24 @@ class YamlPrompt():
         **kwargs,
     ) -> List[str]:
         
-        # Get placeholders for asset and sub-prompt info
-        placeholders = self._get_placeholders()
-
         # Create the system message
         system_message_content = self.template["messages"][0].get('content', '')
-        for placeholder_list in placeholders['system']:
-            for placeholder in placeholder_list:
+        for placeholder, is_task_prompt, _ in self.placeholder_plan['system']:
 
-                placeholder_replaced = "{{" + f"{placeholder}" + "}}"
+            placeholder_replaced = "{{" + f"{placeholder}" + "}}"
 
-                if ASSET.check_task_prompts(name=placeholder):
-                    
-                    # Fetch and render the sub-prompt
-                    sub_prompt_content = ASSET.get_task_prompts(name=placeholder)
-                    rendered_sub_prompt = self.render_template(template_str=sub_prompt_content,
-                                                            params=params)
-                    system_message_content = system_message_content.replace(placeholder_replaced, 
-                                                   rendered_sub_prompt)
-                    
-                elif placeholder in params:
-                    system_message_content = system_message_content.replace(placeholder_replaced,
-                                                                            params[placeholder])
-                    # TODO may need to convert the params value to a str if its a price
+            if is_task_prompt:
+                
+                # Render the compiled sub-prompt
+                rendered_sub_prompt = self.render_task_prompt(name=placeholder,
+                                                              params=params)
+                system_message_content = system_message_content.replace(placeholder_replaced, 
+                                               rendered_sub_prompt)
+                
+            elif placeholder in params:
+                system_message_content = system_message_content.replace(placeholder_replaced,
+                                                                        params[placeholder])
+                # TODO may need to convert the params value to a str if its a price
         
         system_message = {
             "role": "system",
@@ -150,41 +231,43 @@ class YamlPrompt():
         user_message_content = self.template['messages'][1].get('content', '')
         user_messages = []
         image_message = None
-        for placeholder_list in placeholders['user']:
-            for placeholder in placeholder_list:
+        for placeholder, is_task_prompt, image_name in self.placeholder_plan['user']:
 
-                placeholder_replaced = "{{" + f"{placeholder}" + "}}"
+            placeholder_replaced = "{{" + f"{placeholder}" + "}}"
 
-                if ASSET.check_task_prompts(name=placeholder):
-                    
-                    # Fetch and render the sub-prompt
-                    sub_prompt_content = ASSET.get_task_prompts(name=placeholder)
-                    rendered_sub_prompt = self.render_template(template_str=sub_prompt_content,
-                                                            params=params)
-                    user_message_content = user_message_content.replace(placeholder_replaced,
-                                                                        rendered_sub_prompt)
-                elif placeholder in params:
-                    user_message_content = user_message_content.replace(placeholder_replaced,
-                                                                        params[placeholder])
+            if is_task_prompt:
+                
+                # Render the compiled sub-prompt
+                rendered_sub_prompt = self.render_task_prompt(name=placeholder,
+                                                              params=params)
+                user_message_content = user_message_content.replace(placeholder_replaced,
+                                                                    rendered_sub_prompt)
+            elif placeholder in params:
+                user_message_content = user_message_content.replace(placeholder_replaced,
+                                                                    params[placeholder])
 
-                potential_image_name = placeholder + "image"
-                if ASSET.check_task_prompts(name=potential_image_name):
-                    
-                    # Fetch and encode the image
-                    image_content = ASSET.get_task_prompts(name=potential_image_name)
-                    image_placeholder = self._get_path_placeholder(image_content)
-                    str_to_replace = "{{" + f"{image_placeholder}" + "}}"
+            if image_name is not None:
+                
+                # Fetch and encode the image
+                image_content, image_placeholder = get_image_task_prompt(image_name)
+                str_to_replace = "{{" + f"{image_placeholder}" + "}}"
+                image = params.get(image_placeholder)
+                
+                if hasattr(image, "data_url"):
+                    # Rendered in memory (e.g. a ChartImage), embed the bytes directly
+                    image_url = image.data_url()
+                elif isinstance(image, str):
+                    image_content = image_content.replace(str_to_replace,
+                                                        image).strip()
+                    image_url = image_data_url(image_path=image_content)
+                else:
+                    print("No image found for kline chart.")
+                    image_url = None
                     
-                    if image_placeholder in params:
-                        image_content = image_content.replace(str_to_replace,
-                                                            params[image_placeholder]).strip()
-                    else:
-                        print("No image path found for kline chart.")
-                        
-                    image_base64 = encode_image(image_path=image_content)
+                if image_url is not None:
                     image_message = {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
+                        "image_url": {"url": image_url},
                     }
         
         user_message = {
@@ -211,11 +294,8 @@ class YamlPrompt():
         :return: Extracted YAML string.
         :raises ValueError: If no YAML code block is found.
         """
-        import re
-        pattern = r'```yaml\s*\n(.*?)```'
-        
-        # Search for the pattern with DOTALL to include newlines
-        match = re.search(pattern, response, flags=re.DOTALL | re.IGNORECASE)
+        # The pattern is compiled with DOTALL to include newlines
+        match = YAML_BLOCK_PATTERN.search(response)
         
         if match:
             yaml_content = match.group(1).strip()
@@ -227,10 +307,19 @@ class YamlPrompt():
                      provider,
                      messages,
                      model = None,
-                     check_keys=["action", "reasoning"]):
+                     check_keys=["action", "reasoning"],
+                     usage_tracker = None,
+                     date = None):
         
+        start_time = time.perf_counter()
         response, info = provider.create_completion(messages=messages, 
                                                     model=model)
+        if usage_tracker is not None:
+            usage_tracker.record(stage=self.__class__.__name__,
+                                 model=model if model is not None else provider.llm_model,
+                                 info=info,
+                                 latency=time.perf_counter() - start_time,
+                                 date=date)
         print("response from llm model {}: \ninfo: {}\nresponse: \n{}".format(model, info, response))
         
         yaml_content = self.extract_yaml(response=response)
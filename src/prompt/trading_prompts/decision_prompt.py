@@ -2,7 +2,6 @@ import math
 import os
 import backoff
 from typing import Dict, List, Any
-from copy import deepcopy
 
 from src.prompt import YamlPrompt
 from src.asset import ASSET
@@ -10,6 +9,7 @@ from src.memory import MemoryInterface
 from src.provider import EmbeddingProvider
 from src.query import DiverseQuery
 from src.registry import PROMPT
+from src.pipeline import LayeredParams
 
 @PROMPT.register_module(force=True)
 class DecisionPrompt(YamlPrompt):
@@ -28,7 +28,7 @@ class DecisionPrompt(YamlPrompt):
                             provider: EmbeddingProvider = None,
                             diverse_query: DiverseQuery=None) -> Dict:
         
-        res_params = deepcopy(params)
+        res_params = LayeredParams.over(params)
 
         def convert_to_text(ret):
             '''Converts the given asset return into a text string saying what percent it has changed.'''
@@ -68,7 +68,8 @@ class DecisionPrompt(YamlPrompt):
                           provider,
                           model,
                           messages,
-                          check_keys: List[str] = None):
+                          check_keys: List[str] = None,
+                          **kwargs):
         
         check_keys = ["action",
                       "reasoning"]
@@ -76,7 +77,8 @@ class DecisionPrompt(YamlPrompt):
         response = super(DecisionPrompt, self).get_response(provider=provider,
                                                             messages=messages,
                                                             model=model,
-                                                            check_keys=check_keys)
+                                                            check_keys=check_keys,
+                                                            **kwargs)
         response["output"]["action"] = response["output"]["action"].replace(" ", "").replace("\n", "").replace("\t", "").replace("\r", "")
 
         return response
@@ -101,7 +103,9 @@ class DecisionPrompt(YamlPrompt):
         message = self.assemble_messages(params=task_params)
         response = self.get_response(provider=provider,
                                                model=self.model,
-                                               messages=message)
+                                               messages=message,
+                                               usage_tracker=kwargs.get("usage_tracker"),
+                                               date=info["date"])
         
         response = response['output']
         action = response["action"]
@@ -1,47 +1,44 @@
 import math
 import os
 import backoff
+import pandas as pd
 from typing import Dict, List, Any
-from copy import deepcopy
 
 from src.prompt import YamlPrompt
+from src.prompt.packing import TokenBudgetPacker
 from src.asset import ASSET
 from src.memory import MemoryInterface
 from src.provider import EmbeddingProvider
 from src.query import DiverseQuery
 from src.registry import PROMPT
+from src.pipeline import LayeredParams
 
 @PROMPT.register_module(force=True)
 class LatestMarketIntelligenceSummaryPrompt(YamlPrompt):
-    def __init__(self, model, template_path: str) -> None:
+    def __init__(self,
+                 model,
+                 template_path: str,
+                 news_token_budget: int = 6000,
+                 article_max_tokens: int = 512,
+                 max_news_items: int = 20) -> None:
         self.model = model
+        self.news_token_budget = news_token_budget
+        self.article_max_tokens = article_max_tokens
+        self.max_news_items = max_news_items
         super(LatestMarketIntelligenceSummaryPrompt, self).__init__(template_path)
         
-    def _convert_to_params(self,
-                          state: Dict,
-                          info: Dict,
-                          params: Dict,
-                          memory: MemoryInterface,
-                          provider: EmbeddingProvider,
-                          diverse_query: DiverseQuery = None) -> Dict:
-        result_params = deepcopy(params)
-        asset_info = ASSET.get_asset_info(info["symbol"])
-        
-        asset_name = asset_info["company_name"]
-        asset_symbol = asset_info["symbol"]
-        asset_exchange = asset_info["exchange"]
-        asset_sector = asset_info["sector"]
-        asset_description = asset_info["description"]
+    def prepare_params(self,
+                       state: Dict,
+                       info: Dict,
+                       provider: EmbeddingProvider = None) -> Dict:
         current_date = info["date"]
         
-        price = deepcopy(state["price"])
-        news = deepcopy(state["news"])
+        # Filtering already returns new frames, the state itself is never modified
+        price = state["price"]
+        news = state["news"]
         
         price = price[price.index == current_date]
         news = news[news.index == current_date]
-        
-        if len(news) > 20:
-            news = news.sample(n=20)
             
         latest_market_intelligence_text = f"Date: Today is {current_date}.\n"
         
@@ -57,18 +54,28 @@ class LatestMarketIntelligenceSummaryPrompt(YamlPrompt):
             
         if len(news) > 0:
             latest_market_intelligence_list = []
+            recency = []
+            packer = TokenBudgetPacker(provider=provider,
+                                       token_budget=self.news_token_budget,
+                                       max_items=self.max_news_items)
             
             for row in news.iterrows():
                 row = row[1]
                 news_id = row["id"]
                 title = row["title"]
-                text = row["text"]
+                text = packer.truncate(row["text"], self.article_max_tokens)
                 
                 latest_market_intelligence_item = f"ID: {news_id}\n" \
                                           f"Headline: {title}\n" \
                                           f"Content: {text}\n"   
                 latest_market_intelligence_list.append(latest_market_intelligence_item)        
 
+                # The most recently published articles are packed first
+                recency.append(-pd.Timestamp(row["published_at"]).value)
+
+            latest_market_intelligence_list = packer.pack(latest_market_intelligence_list,
+                                                          priorities=recency)
+
             if len(latest_market_intelligence_list) == 0:
                 latest_market_intelligence_text += "There is no latest market intelligence.\n"
             else:
@@ -76,6 +83,33 @@ class LatestMarketIntelligenceSummaryPrompt(YamlPrompt):
                 latest_market_intelligence_text += news_text
         else:
             latest_market_intelligence_text += "There is no latest market intelligence.\n"
+        
+        return {
+            "latest_market_intelligence": latest_market_intelligence_text,
+        }
+        
+    def _convert_to_params(self,
+                          state: Dict,
+                          info: Dict,
+                          params: Dict,
+                          memory: MemoryInterface,
+                          provider: EmbeddingProvider,
+                          diverse_query: DiverseQuery = None) -> Dict:
+        result_params = LayeredParams.over(params)
+        asset_info = ASSET.get_asset_info(info["symbol"])
+        
+        asset_name = asset_info["company_name"]
+        asset_symbol = asset_info["symbol"]
+        asset_exchange = asset_info["exchange"]
+        asset_sector = asset_info["sector"]
+        asset_description = asset_info["description"]
+        current_date = info["date"]
+        
+        # The news block may have been rendered ahead of time
+        if "latest_market_intelligence" not in params:
+            result_params.update(self.prepare_params(state=state,
+                                                     info=info,
+                                                     provider=provider))
             
         result_params.update({
             "date": current_date,
@@ -84,7 +118,6 @@ class LatestMarketIntelligenceSummaryPrompt(YamlPrompt):
             "asset_exchange": asset_exchange,
             "asset_sector": asset_sector,
             "asset_description": asset_description,
-            "latest_market_intelligence": latest_market_intelligence_text,
         })
         
         return result_params
@@ -94,7 +127,8 @@ class LatestMarketIntelligenceSummaryPrompt(YamlPrompt):
                           provider,
                           model,
                           messages,
-                          check_keys: List[str] = None):
+                          check_keys: List[str] = None,
+                          **kwargs):
 
         check_keys = [
             "query",
@@ -104,7 +138,8 @@ class LatestMarketIntelligenceSummaryPrompt(YamlPrompt):
         response_dict = super(LatestMarketIntelligenceSummaryPrompt, self).get_response(provider=provider,
                                                                                         model=model,
                                                                                         messages=messages,
-                                                                                        check_keys=check_keys)
+                                                                                        check_keys=check_keys,
+                                                                                        **kwargs)
 
         return response_dict
     
@@ -114,13 +149,14 @@ class LatestMarketIntelligenceSummaryPrompt(YamlPrompt):
                       result: Dict,
                       memory: MemoryInterface = None,
                       provider: EmbeddingProvider = None) -> None:
-        response_dict = deepcopy(result["response_dict"])
+        response_dict = result["response_dict"]
         
         current_date = info["date"]
         symbol = info["symbol"]
         
-        price = deepcopy(state["price"])
-        news = deepcopy(state["news"])
+        # Filtering already returns new frames, the state itself is never modified
+        price = state["price"]
+        news = state["news"]
         
         price = price[price.index == current_date]
         news = news[news.index == current_date]
@@ -192,7 +228,9 @@ class LatestMarketIntelligenceSummaryPrompt(YamlPrompt):
         message = self.assemble_messages(params=task_params)
         response_dict = self.get_response(provider=provider,
                                                model=self.model,
-                                               messages=message)
+                                               messages=message,
+                                               usage_tracker=kwargs.get("usage_tracker"),
+                                               date=info["date"])
         response_dict = response_dict['output']
         query = response_dict["query"]
         summary = response_dict["summary"]
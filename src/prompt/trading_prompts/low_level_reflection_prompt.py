@@ -3,7 +3,6 @@ import os
 import backoff
 import pandas as pd
 from typing import Dict, List, Any
-from copy import deepcopy
 
 from src.prompt import YamlPrompt
 from src.asset import ASSET
@@ -11,6 +10,7 @@ from src.memory import MemoryInterface
 from src.provider import EmbeddingProvider
 from src.query import DiverseQuery
 from src.registry import PROMPT
+from src.pipeline import LayeredParams
 
 @PROMPT.register_module(force=True)
 class LowLevelReflectionPrompt(YamlPrompt):
@@ -41,6 +41,30 @@ class LowLevelReflectionPrompt(YamlPrompt):
 
         super(LowLevelReflectionPrompt, self).__init__(template_path=template_path)
 
+    def _price_movement_from_indicators(self, indicators: pd.DataFrame, current_date: str = None):
+        '''Reads the past and next price movements from precomputed indicators, or returns None if they are missing.'''
+        if indicators is None or pd.Timestamp(current_date) not in indicators.index:
+            return None
+
+        row = indicators.loc[pd.Timestamp(current_date)]
+
+        def movement(prefix, period, window):
+            column = f"{prefix}_{period}"
+            if column not in row.index:
+                raise KeyError(column)
+            # Movements reaching past the state window are unknown, as when computed from the window
+            return row[column] if period <= window else math.nan
+
+        try:
+            return (movement("ret", self.short_term_past_date_range, self.look_back_days),
+                    movement("ret", self.medium_term_past_date_range, self.look_back_days),
+                    movement("ret", self.long_term_past_date_range, self.look_back_days),
+                    movement("fwd_ret", self.short_term_next_date_range, self.look_forward_days),
+                    movement("fwd_ret", self.medium_term_next_date_range, self.look_forward_days),
+                    movement("fwd_ret", self.long_term_next_date_range, self.look_forward_days))
+        except KeyError:
+            return None
+
     def _convert_to_price_movement(self, state: Dict, current_date: str = None):
 
         def price_movement_to_text(x):
@@ -53,26 +77,35 @@ class LowLevelReflectionPrompt(YamlPrompt):
             else:
                 return "unknown"
             
-        price = state["price"]
-        price = deepcopy(price)
-        price = price.reset_index(drop=False)
-        price = price[["timestamp", "close"]]
-        price = price.dropna(axis=0, how="any")
-        price = price.drop_duplicates(subset=["timestamp"], keep="first")
-
-        past_price = price[price["timestamp"] <= current_date]
-        next_price = price[price["timestamp"] >= current_date]
-
-        short_term_past_price_movement = past_price["close"].pct_change(periods=self.short_term_past_date_range).iloc[-1]
-        medium_term_past_price_movement = past_price["close"].pct_change(periods=self.medium_term_past_date_range).iloc[-1]
-        long_term_past_price_movement = past_price["close"].pct_change(periods=self.long_term_past_date_range).iloc[-1]
+        movements = self._price_movement_from_indicators(state.get("indicators"), current_date)
+        if movements is not None:
+            (short_term_past_price_movement,
+             medium_term_past_price_movement,
+             long_term_past_price_movement,
+             short_term_next_price_movement,
+             medium_term_next_price_movement,
+             long_term_next_price_movement) = movements
+        else:
+            price = state["price"]
+            price = price.reset_index(drop=False)
+            price = price[["timestamp", "close"]]
+            price = price.dropna(axis=0, how="any")
+            price = price.drop_duplicates(subset=["timestamp"], keep="first")
+
+            past_price = price[price["timestamp"] <= current_date]
+            next_price = price[price["timestamp"] >= current_date]
+
+            short_term_past_price_movement = past_price["close"].pct_change(periods=self.short_term_past_date_range).iloc[-1]
+            medium_term_past_price_movement = past_price["close"].pct_change(periods=self.medium_term_past_date_range).iloc[-1]
+            long_term_past_price_movement = past_price["close"].pct_change(periods=self.long_term_past_date_range).iloc[-1]
+            short_term_next_price_movement = next_price["close"].pct_change(periods=self.short_term_next_date_range).shift(-self.short_term_next_date_range).iloc[0]
+            medium_term_next_price_movement = next_price["close"].pct_change(periods=self.medium_term_next_date_range).shift(-self.medium_term_next_date_range).iloc[0]
+            long_term_next_price_movement = next_price["close"].pct_change(periods=self.long_term_next_date_range).shift(-self.long_term_next_date_range).iloc[0]
+
         short_term_past_price_movement_text = price_movement_to_text(short_term_past_price_movement)
         medium_term_past_price_movement_text = price_movement_to_text(medium_term_past_price_movement)
         long_term_past_price_movement_text = price_movement_to_text(long_term_past_price_movement)
 
-        short_term_next_price_movement = next_price["close"].pct_change(periods=self.short_term_next_date_range).shift(-self.short_term_next_date_range).iloc[0]
-        medium_term_next_price_movement = next_price["close"].pct_change(periods=self.medium_term_next_date_range).shift(-self.medium_term_next_date_range).iloc[0]
-        long_term_next_price_movement = next_price["close"].pct_change(periods=self.long_term_next_date_range).shift(-self.long_term_next_date_range).iloc[0]
         short_term_next_price_movement_text = price_movement_to_text(short_term_next_price_movement)
         medium_term_next_price_movement_text = price_movement_to_text(medium_term_next_price_movement)
         long_term_next_price_movement_text = price_movement_to_text(long_term_next_price_movement)
@@ -94,6 +127,12 @@ class LowLevelReflectionPrompt(YamlPrompt):
 
         return res
 
+    def prepare_params(self,
+                       state: Dict,
+                       info: Dict,
+                       provider: EmbeddingProvider = None) -> Dict:
+        return self._convert_to_price_movement(state, current_date=info["date"])
+
     def _convert_to_params(self,
                          state: Dict,
                          info: Dict,
@@ -102,12 +141,11 @@ class LowLevelReflectionPrompt(YamlPrompt):
                          provider: EmbeddingProvider = None,
                          diverse_query: DiverseQuery = None) -> Dict:
 
-        res_params = deepcopy(params)
-
-        current_date = info["date"]
-        price_movement = self._convert_to_price_movement(state, current_date=current_date)
+        res_params = LayeredParams.over(params)
 
-        res_params.update(price_movement)
+        # Price movements may have been computed ahead of time
+        if "short_term_past_price_movement" not in params:
+            res_params.update(self.prepare_params(state=state, info=info))
 
         return res_params
 
@@ -116,7 +154,8 @@ class LowLevelReflectionPrompt(YamlPrompt):
                           provider,
                           model,
                           messages,
-                          check_keys: List[str] = None):
+                          check_keys: List[str] = None,
+                          **kwargs):
 
         check_keys = [
             "reasoning",
@@ -126,7 +165,8 @@ class LowLevelReflectionPrompt(YamlPrompt):
         response = super(LowLevelReflectionPrompt, self).get_response(provider=provider,
                                                             messages=messages,
                                                             model=model,
-                                                            check_keys=check_keys)
+                                                            check_keys=check_keys,
+                                                            **kwargs)
         return response
     
     def add_to_memory(self,
@@ -137,8 +177,11 @@ class LowLevelReflectionPrompt(YamlPrompt):
                      provider: EmbeddingProvider = None) -> None:
         symbol = info["symbol"]
 
-        data = deepcopy(res["params"])
-        response_dict = deepcopy(res["response_dict"])
+        # A flat shallow copy is enough, stored values are never mutated in place
+        data = dict(res["params"])
+        # Chart bytes are not stored, the record keeps the kline path
+        data.pop("kline_image", None)
+        response_dict = res["response_dict"]
 
         embedding_text = response_dict["query"]
         embedding = provider.embed_query(embedding_text)
@@ -175,7 +218,9 @@ class LowLevelReflectionPrompt(YamlPrompt):
         message = self.assemble_messages(params=task_params)
         response_dict = self.get_response(provider=provider,
                                                model=self.model,
-                                               messages=message)
+                                               messages=message,
+                                               usage_tracker=kwargs.get("usage_tracker"),
+                                               date=info["date"])
         response_dict = response_dict['output']
         reasoning = response_dict["reasoning"]
         query = response_dict["query"]
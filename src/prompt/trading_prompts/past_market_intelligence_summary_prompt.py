@@ -2,7 +2,6 @@ import math
 import os
 import backoff
 from typing import Dict, List, Any
-from copy import deepcopy
 
 from src.prompt import YamlPrompt
 from src.asset import ASSET
@@ -10,6 +9,7 @@ from src.memory import MemoryInterface
 from src.provider import EmbeddingProvider
 from src.query import DiverseQuery
 from src.registry import PROMPT
+from src.pipeline import LayeredParams
 
 @PROMPT.register_module(force=True)
 class PastMarketIntelligenceSummaryPrompt(YamlPrompt):
@@ -27,7 +27,7 @@ class PastMarketIntelligenceSummaryPrompt(YamlPrompt):
                             memory: MemoryInterface,
                             provider: EmbeddingProvider,
                             diverse_query: DiverseQuery = None) -> Dict:
-        res_params = deepcopy(params)
+        res_params = LayeredParams.over(params)
         return res_params
     
     @backoff.on_exception(backoff.constant, (KeyError), max_tries=3, interval=10)
@@ -35,7 +35,8 @@ class PastMarketIntelligenceSummaryPrompt(YamlPrompt):
                     provider,
                     model,
                     messages,
-                    check_keys: List[str] = None):
+                    check_keys: List[str] = None,
+                    **kwargs):
 
         check_keys = [
             "summary"
@@ -44,7 +45,8 @@ class PastMarketIntelligenceSummaryPrompt(YamlPrompt):
         response_dict = super(PastMarketIntelligenceSummaryPrompt, self).get_response(provider=provider,
                                                                                         model=model,
                                                                                         messages=messages,
-                                                                                        check_keys=check_keys)
+                                                                                        check_keys=check_keys,
+                                                                                        **kwargs)
 
         return response_dict
     
@@ -76,7 +78,9 @@ class PastMarketIntelligenceSummaryPrompt(YamlPrompt):
         message = self.assemble_messages(params=task_params)
         response_dict = self.get_response(provider=provider,
                                                model=self.model,
-                                               messages=message)
+                                               messages=message,
+                                               usage_tracker=kwargs.get("usage_tracker"),
+                                               date=info["date"])
         response_dict = response_dict['output']
         summary = response_dict["summary"]
         
@@ -1,9 +1,15 @@
 from .base_embedding import EmbeddingProvider
 from .base_llm import LLMProvider
 from .provider import OpenAIProvider
+from .async_provider import AsyncOpenAIProvider
+from .offline_provider import OfflineProvider
+from .local_embedding import LocalEmbeddingProvider
 
 __all__ = [
     "LLMProvider",
     "EmbeddingProvider",
     "OpenAIProvider",
+    "AsyncOpenAIProvider",
+    "OfflineProvider",
+    "LocalEmbeddingProvider",
 ]
\ No newline at end of file
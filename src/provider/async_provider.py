@@ -0,0 +1,277 @@
+import os
+import asyncio
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+import backoff
+import httpx
+import numpy as np
+from openai import (AsyncOpenAI, AsyncAzureOpenAI, DefaultAsyncHttpxClient,
+                    APIError, RateLimitError, APITimeoutError)
+
+from src.registry import PROVIDER
+from src.provider.provider import (OpenAIProvider,
+                                   PROVIDER_SETTING_KEY_VAR,
+                                   PROVIDER_SETTING_IS_AZURE,
+                                   PROVIDER_SETTING_BASE_VAR,
+                                   PROVIDER_SETTING_API_VERSION)
+
+PROVIDER_SETTING_MAX_CONCURRENCY = "max_concurrency"   # In-flight request limit for the async client
+PROVIDER_SETTING_MAX_CONNECTIONS = "max_connections"   # Size of the shared HTTP connection pool
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_CONNECTIONS = 32
+
+@PROVIDER.register_module(force=True)
+class AsyncOpenAIProvider(OpenAIProvider):
+    """An OpenAIProvider that can also issue requests without blocking the caller.
+
+    The synchronous API is inherited unchanged. The async API shares one pooled HTTP
+    client across all requests of this provider, and a semaphore bounds how many
+    requests are in flight at once, so independent prompts (or several assets sharing
+    the provider) can overlap their network latency.
+
+    The pooled client belongs to the event loop that first used it. It is closed when
+    `aclose()` is awaited or, under `asyncio.run`, when that loop shuts down, so the
+    provider can be reused by a later `asyncio.run`.
+    """
+
+    async_client: Any = None
+
+    def init_provider(self, provider_cfg) -> None:
+        super(AsyncOpenAIProvider, self).init_provider(provider_cfg)
+
+        self.max_concurrency = int(self.provider_cfg.get(PROVIDER_SETTING_MAX_CONCURRENCY,
+                                                         DEFAULT_MAX_CONCURRENCY))
+        self.max_connections = int(self.provider_cfg.get(PROVIDER_SETTING_MAX_CONNECTIONS,
+                                                         DEFAULT_MAX_CONNECTIONS))
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._async_client_loop = None
+        self._async_client_closer = None
+
+    def _get_async_client(self) -> Any:
+        """Return the async client and its pooled HTTP transport bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self.async_client is not None:
+            if self._async_client_loop is loop:
+                return self.async_client
+            # Pooled connections can only be closed on the loop that opened them
+            raise RuntimeError("The async client is still open on another event loop, "
+                               "await aclose() on that loop before using the provider on a new one.")
+
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+        )
+
+        key = os.getenv(self.provider_cfg[PROVIDER_SETTING_KEY_VAR])
+        if self.provider_cfg[PROVIDER_SETTING_IS_AZURE]:
+            self.async_client = AsyncAzureOpenAI(
+                api_key = key,
+                api_version = self.provider_cfg[PROVIDER_SETTING_API_VERSION],
+                azure_endpoint = os.getenv(self.provider_cfg[PROVIDER_SETTING_BASE_VAR]),
+                http_client = http_client,
+            )
+        else:
+            self.async_client = AsyncOpenAI(api_key=key,
+                                            http_client=http_client)
+        self._async_client_loop = loop
+        self._async_client_closer = loop.create_task(self._close_on_shutdown(self.async_client))
+
+        return self.async_client
+
+    async def _close_on_shutdown(self, client: Any) -> None:
+        """Wait until the owning loop cancels its tasks on shutdown, then close `client` on it."""
+        try:
+            await asyncio.get_running_loop().create_future()
+        finally:
+            if self.async_client is client:
+                self.async_client = None
+                self._async_client_loop = None
+                self._async_client_closer = None
+                await client.close()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Return the in-flight request semaphore bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def aembed_with_retry(self, **kwargs: Any) -> Any:
+        """Use backoff to retry the async embedding call."""
+
+        @backoff.on_exception(
+            backoff.expo,
+            (
+                APIError,
+                RateLimitError,
+                APITimeoutError,
+            ),
+            max_tries=self.retries,
+            max_value=10,
+            jitter=None,
+        )
+        async def _aembed_with_retry(**kwargs: Any) -> Any:
+            async with self._get_semaphore():
+                response = await self._get_async_client().embeddings.create(**kwargs)
+            if any(len(d.embedding) == 1 for d in response.data):
+                raise RuntimeError("OpenAI API returned an empty embedding")
+            return response
+
+        return await _aembed_with_retry(**kwargs)
+
+    async def aembed_documents(
+        self,
+        texts: List[str],
+    ) -> List[List[float]]:
+        """Async counterpart of `embed_documents`.
+
+        All chunk batches are sent concurrently, bounded by the provider semaphore.
+
+        Args:
+            texts: The list of texts to embed.
+
+        Returns:
+            List of embeddings, one for each text.
+        """
+        tokens, indices = self._tokenize_for_embedding(texts)
+
+        responses = await asyncio.gather(*[
+            self.aembed_with_retry(
+                input=tokens[i : i + self.chunk_size],
+                **self._emb_invocation_params,
+            )
+            for i in range(0, len(tokens), self.chunk_size)
+        ])
+
+        batched_embeddings: List[List[float]] = []
+        for response in responses:
+            batched_embeddings.extend(r.embedding for r in response.data)
+
+        embeddings = self._combine_chunk_embeddings(len(texts), tokens, indices, batched_embeddings)
+
+        if any(embedding is None for embedding in embeddings):
+            response = await self.aembed_with_retry(
+                input="",
+                **self._emb_invocation_params,
+            )
+            average = np.asarray(response.data[0].embedding)
+            empty_embedding = (average / np.linalg.norm(average)).tolist()
+            embeddings = [empty_embedding if embedding is None else embedding
+                          for embedding in embeddings]
+
+        return embeddings
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async counterpart of `embed_query`.
+
+        Args:
+            text: The text to embed.
+
+        Returns:
+            Embedding for the text.
+        """
+        return (await self.aembed_documents([text]))[0]
+
+    async def acreate_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str | None = None,
+        temperature: float = 1.0,
+        seed: int | None = 42,
+        max_tokens: int = 4096,
+    ) -> Tuple[str, Dict[str, int]]:
+        """Async counterpart of `create_completion`.
+
+        Retries use the same policy as the synchronous call. Waiting on a retry does not
+        hold a semaphore slot, so other requests can proceed in the meantime.
+        """
+
+        if model is None:
+            model = self.llm_model
+
+        cache_key = None
+        if self.completion_cache is not None:
+            cache_key = self.completion_cache.make_key(messages, model, temperature, seed, max_tokens)
+            cached = self.completion_cache.get(cache_key)
+            if cached is not None:
+                message, info = cached
+                return message, dict(info, cached=True)
+
+        prompt_tokens_estimate = 0
+        if self.rate_limiter is not None:
+            prompt_tokens_estimate = self.estimate_prompt_tokens(messages, model)
+
+        @backoff.on_exception(
+            backoff.constant,
+            (
+                APIError,
+                RateLimitError,
+                APITimeoutError),
+            max_tries=self.retries,
+            interval=10,
+        )
+        async def _agenerate_response_with_retry(
+            messages: List[Dict[str, str]],
+            model: str,
+            temperature: float,
+            seed: int | None,
+            max_tokens: int = 512,
+        ) -> Tuple[str, Dict[str, int]]:
+
+            """Send a request to the OpenAI API."""
+
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async(prompt_tokens_estimate + max_tokens)
+
+            async with self._get_semaphore():
+                response = await self._get_async_client().chat.completions.create(
+                    **self._comp_invocation_params(model),
+                    messages=messages,
+                    temperature=temperature,
+                    seed=seed,
+                    max_tokens=max_tokens,
+                )
+
+            return self._parse_completion_response(response)
+
+        message, info = await _agenerate_response_with_retry(
+            messages,
+            model,
+            temperature,
+            seed,
+            max_tokens,
+        )
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.reconcile(prompt_tokens_estimate, info["prompt_tokens"])
+
+        if cache_key is not None:
+            self.completion_cache.set(cache_key, message, info)
+
+        return message, info
+
+    async def aclose(self) -> None:
+        """Close the async client and release its pooled connections.
+
+        Must be awaited on the event loop that used the client.
+        """
+        if self.async_client is None:
+            return
+        if self._async_client_loop is not asyncio.get_running_loop():
+            raise RuntimeError("aclose() must be awaited on the event loop that opened the async client.")
+
+        client = self.async_client
+        self.async_client = None
+        self._async_client_loop = None
+        self._async_client_closer.cancel()
+        self._async_client_closer = None
+        await client.close()
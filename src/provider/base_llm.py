@@ -30,4 +30,14 @@ class LLMProvider(abc.ABC):
     @abc.abstractmethod
     def assemble_prompt(self, system_prompts: List[str], user_inputs: List[str], image_filenames: List[str]) -> List[str]:
         """Combine parametes in the appropriate way for the provider to use."""
-        pass
\ No newline at end of file
+        pass
+
+    def count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        """Count the tokens of a text. Defaults to an estimate of four characters per token."""
+        return (len(text) + 3) // 4
+
+    def truncate_to_tokens(self, text: str, max_tokens: int, model: Optional[str] = None) -> str:
+        """Cut a text down to at most max_tokens tokens."""
+        if self.count_tokens(text, model=model) <= max_tokens:
+            return text
+        return text[:max_tokens * 4]
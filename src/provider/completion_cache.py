@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+class CompletionCache():
+    """Content-addressed on-disk cache of chat completions.
+
+    Entries are keyed by a hash of everything that determines the response of a seeded
+    request: model, temperature, seed, max_tokens and the full message list (which
+    carries encoded images inline, so image bytes are part of the key). Values live in
+    a SQLite file so they survive crashes and can be shared by concurrent processes.
+    When the stored payload exceeds `max_size_bytes` the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self,
+                 cache_path: str,
+                 max_size_bytes: int = 512 * 1024 * 1024) -> None:
+        """
+        Args:
+            cache_path: Path of the SQLite file backing the cache.
+            max_size_bytes: Upper bound on the total size of cached responses.
+        """
+        self.cache_path = cache_path
+        self.max_size_bytes = max_size_bytes
+
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path,
+                                     timeout=30,
+                                     check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, "
+            "message TEXT NOT NULL, "
+            "info TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)"
+        )
+
+    @staticmethod
+    def make_key(messages: List[Dict[str, Any]],
+                 model: str,
+                 temperature: float,
+                 seed: Optional[int],
+                 max_tokens: int) -> str:
+        """Hash the request parameters into a cache key."""
+        hasher = hashlib.sha256()
+        header = json.dumps([model, temperature, seed, max_tokens])
+        hasher.update(header.encode("utf-8"))
+        hasher.update(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, int]]]:
+        """Return the cached (message, info) pair for `key`, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message, info FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE completions SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+
+        message, info = row
+        return message, json.loads(info)
+
+    def set(self, key: str, message: str, info: Dict[str, int]) -> None:
+        """Store a completion and evict old entries if the cache grew past its limit."""
+        info = json.dumps(info)
+        size = len(message.encode("utf-8")) + len(info)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, message, info, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, message, info, size, time.time()),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the total size fits the limit."""
+        total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM completions"
+        ).fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM completions ORDER BY last_access ASC"
+        ).fetchall()
+
+        expired = []
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            expired.append((key,))
+            total_size -= size
+
+        self._conn.executemany("DELETE FROM completions WHERE key = ?", expired)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,145 @@
+import re
+import hashlib
+from typing import (
+    Any,
+    List,
+    Optional,
+)
+
+import numpy as np
+
+from src.registry import PROVIDER
+from src.provider import EmbeddingProvider
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+@PROVIDER.register_module(force=True)
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """Embeds text on the local CPU instead of calling a remote API.
+
+    With `model_name` set, a sentence-transformers model is loaded and run in batches.
+    Without it (or when sentence-transformers is not installed and `allow_fallback` is
+    set) texts are embedded with a hashing projection: log-scaled counts of word
+    unigrams and bigrams hashed into `embedding_dim` signed buckets. The fallback needs
+    no downloads and is deterministic, so it also works on air-gapped machines.
+
+    Model inference runs in batches of `batch_size` on `num_threads` intra-op threads.
+    """
+
+    def __init__(self,
+                 model_name: Optional[str] = None,
+                 embedding_dim: int = 384,
+                 batch_size: int = 64,
+                 num_threads: int = 4,
+                 device: str = "cpu",
+                 allow_fallback: bool = True) -> None:
+        """Initialize a class instance
+
+        Args:
+            model_name: sentence-transformers model to load, e.g. "all-MiniLM-L6-v2". None uses the hashing projection.
+            embedding_dim: Dimension of the hashing projection. Ignored when a model is loaded.
+            batch_size: Number of texts embedded per batch.
+            num_threads: Number of threads torch uses for model inference.
+            device: Device the model runs on.
+            allow_fallback: Use the hashing projection if the model cannot be loaded.
+
+        Returns:
+            None
+        """
+        self.init_provider(dict(model_name=model_name,
+                                embedding_dim=embedding_dim,
+                                batch_size=batch_size,
+                                num_threads=num_threads,
+                                device=device,
+                                allow_fallback=allow_fallback))
+
+    def init_provider(self, provider_cfg) -> None:
+        self.provider_cfg = provider_cfg
+        self.model_name = provider_cfg.get("model_name")
+        self.embedding_dim = int(provider_cfg.get("embedding_dim", 384))
+        self.batch_size = int(provider_cfg.get("batch_size", 64))
+        self.num_threads = max(int(provider_cfg.get("num_threads", 4)), 1)
+        self.device = provider_cfg.get("device", "cpu")
+        self.model = self._load_model(allow_fallback=provider_cfg.get("allow_fallback", True))
+
+        if self.model is not None:
+            self.embedding_dim = self.model.get_sentence_embedding_dimension()
+
+    def _load_model(self, allow_fallback: bool) -> Any:
+        if self.model_name is None:
+            return None
+
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            if not allow_fallback:
+                raise ImportError(
+                    "Could not import sentence_transformers python package. "
+                    "This is needed in order to run local embedding models. "
+                    "Please install it with `pip install sentence-transformers`."
+                )
+            print(f"Warning: sentence_transformers not installed. Using the hashing projection instead of {self.model_name}.")
+            return None
+
+        torch.set_num_threads(self.num_threads)
+        return SentenceTransformer(self.model_name, device=self.device)
+
+    def _hash_embed(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.embedding_dim), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text.lower())
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+            counts = {}
+            for feature in features:
+                counts[feature] = counts.get(feature, 0) + 1
+
+            for feature, count in counts.items():
+                value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                sign = 1.0 if value & 1 else -1.0
+                embeddings[row, (value >> 1) % self.embedding_dim] += sign * (1.0 + np.log(count))
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        embeddings[empty, 0] = 1.0
+        norms[empty] = 1.0
+        return embeddings / norms
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of texts in batches.
+
+        Args:
+            texts: The list of texts to embed.
+
+        Returns:
+            List of embeddings, one for each text.
+        """
+        if len(texts) == 0:
+            return []
+
+        if self.model is None:
+            return self._hash_embed(texts).tolist()
+
+        embeddings = self.model.encode(texts,
+                                       batch_size=self.batch_size,
+                                       convert_to_numpy=True,
+                                       normalize_embeddings=True,
+                                       show_progress_bar=False)
+        return embeddings.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text.
+
+        Args:
+            text: The text to embed.
+
+        Returns:
+            Embedding for the text.
+        """
+        return self.embed_documents([text])[0]
+
+    def get_embedding_dim(self) -> int:
+        """Get the embedding dimension."""
+        return self.embedding_dim
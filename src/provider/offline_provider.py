@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+import numpy as np
+
+from src.registry import PROVIDER
+from src.provider import LLMProvider, EmbeddingProvider
+from src.provider.provider import image_data_url
+from src.utils import assemble_project_path, load_json
+
+PROVIDER_SETTING_EMB_DIM = "embedding_dim"
+PROVIDER_SETTING_LATENCY = "latency"                     # Seconds slept per completion
+PROVIDER_SETTING_EMB_LATENCY = "embedding_latency"       # Seconds slept per embedding batch
+PROVIDER_SETTING_COMP_MODEL = "comp_model"
+PROVIDER_SETTING_IMAGE_TOKENS = "image_tokens"          # Prompt tokens charged per attached image
+PROVIDER_SETTING_PROMPT_LOG_PATH = "prompt_log_path"    # Optional JSON lines file recording every prompt
+
+ACTIONS = ["BUY", "SELL", "HOLD"]
+TERMS = ["short_term", "medium_term", "long_term"]
+
+@PROVIDER.register_module(force=True)
+class OfflineProvider(LLMProvider, EmbeddingProvider):
+    """A deterministic stand-in for OpenAIProvider that never touches the network.
+
+    Completions are canned YAML answers matching the output format requested by each
+    trading prompt, chosen from a hash of the messages so the same input always yields
+    the same answer. Embeddings are feature-hashed bags of words, so texts sharing
+    words are close in embedding space and memory retrieval still behaves sensibly.
+    An artificial latency can be configured to emulate the remote model, and every
+    prompt can be recorded to compare what different runs send to the model.
+    """
+
+    llm_model: str = "offline"
+    embedding_dim: int = 3072
+    latency: float = 0.0
+    embedding_latency: float = 0.0
+    image_tokens: int = 765
+    prompt_log_path: Optional[str] = None
+
+    def __init__(self, provider_cfg_path: Optional[str] = None, **kwargs) -> None:
+        """Initialize a class instance
+
+        Args:
+            provider_cfg_path: Optional json config, see configs/provider_configs/offline_config.json.
+            kwargs: Settings overriding the ones in the config file.
+
+        Returns:
+            None
+        """
+        provider_cfg = dict()
+        if provider_cfg_path is not None:
+            provider_cfg = load_json(assemble_project_path(provider_cfg_path))
+        provider_cfg.update(kwargs)
+        self.init_provider(provider_cfg)
+
+    def init_provider(self, provider_cfg) -> None:
+        self.provider_cfg = provider_cfg
+        self.llm_model = provider_cfg.get(PROVIDER_SETTING_COMP_MODEL, self.llm_model)
+        self.embedding_dim = int(provider_cfg.get(PROVIDER_SETTING_EMB_DIM, self.embedding_dim))
+        self.latency = float(provider_cfg.get(PROVIDER_SETTING_LATENCY, self.latency))
+        self.embedding_latency = float(provider_cfg.get(PROVIDER_SETTING_EMB_LATENCY, self.embedding_latency))
+        self.image_tokens = int(provider_cfg.get(PROVIDER_SETTING_IMAGE_TOKENS, self.image_tokens))
+
+        self.prompt_log_path = provider_cfg.get(PROVIDER_SETTING_PROMPT_LOG_PATH)
+        if self.prompt_log_path is not None:
+            self.prompt_log_path = assemble_project_path(self.prompt_log_path)
+            os.makedirs(os.path.dirname(self.prompt_log_path), exist_ok=True)
+        self._prompt_log_lock = threading.Lock()
+
+    def _embed(self, text: str) -> List[float]:
+        embedding = np.zeros(self.embedding_dim, dtype=np.float64)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            embedding[(value >> 1) % self.embedding_dim] += sign
+
+        norm = np.linalg.norm(embedding)
+        if norm == 0:
+            embedding[0] = 1.0
+            norm = 1.0
+        return (embedding / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of texts.
+
+        Args:
+            texts: The list of texts to embed.
+
+        Returns:
+            List of embeddings, one for each text.
+        """
+        if self.embedding_latency > 0:
+            time.sleep(self.embedding_latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text.
+
+        Args:
+            text: The text to embed.
+
+        Returns:
+            Embedding for the text.
+        """
+        return self.embed_documents([text])[0]
+
+    def get_embedding_dim(self) -> int:
+        """Get the embedding dimension."""
+        return self.embedding_dim
+
+    @staticmethod
+    def _message_text(messages: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+        texts = []
+        image_urls = []
+        for message in messages:
+            content = message.get("content", "")
+            if isinstance(content, str):
+                texts.append(content)
+                continue
+            for item in content:
+                if item.get("type") == "text":
+                    texts.append(item["text"])
+                elif item.get("type") == "image_url":
+                    image_urls.append(item["image_url"]["url"])
+        return "\n".join(texts), image_urls
+
+    def _log_prompt(self, text: str, image_urls: List[str]) -> None:
+        """Append the prompt to the prompt log, images are recorded by their digest."""
+        record = {
+            "text": text,
+            "images": [hashlib.sha256(image_url.encode("utf-8")).hexdigest() for image_url in image_urls],
+        }
+        with self._prompt_log_lock:
+            with open(self.prompt_log_path, "a") as op:
+                op.write(json.dumps(record) + "\n")
+
+    def _render_response(self, text: str, digest: bytes) -> str:
+        """Build a YAML answer in the output format the prompt asked for."""
+        tag = digest.hex()[:8]
+
+        # The requested output format is the last yaml block of the prompt
+        output_format = text.rsplit("```yaml", 1)[-1]
+
+        if "short_term_query" in output_format:
+            # Latest market intelligence summary
+            body = ("output:\n"
+                    "  analysis:\n"
+                    f"    - ID: \"000000 - Offline analysis {tag}.\"\n"
+                    f"  summary: \"Offline summary {tag} of the latest market intelligence.\"\n"
+                    "  query:\n")
+            for term in TERMS:
+                body += f"    {term}_query: \"Offline {term.replace('_', '-')} query {tag} about the asset price outlook.\"\n"
+        elif "short_term_reasoning" in output_format:
+            # Low level reflection
+            body = "output:\n  reasoning:\n"
+            for term in TERMS:
+                body += f"    {term}_reasoning: \"Offline {term.replace('_', '-')} reasoning {tag}.\"\n"
+            body += f"  query: \"Offline reflection query {tag} about recent price movements of the asset.\"\n"
+        elif "action:" in output_format:
+            # Decision
+            action = ACTIONS[digest[0] % len(ACTIONS)]
+            body = ("output:\n"
+                    f"  analysis: \"Offline analysis {tag}.\"\n"
+                    f"  action: \"{action}\"\n"
+                    f"  reasoning: \"Offline reasoning {tag} for {action}.\"\n")
+        else:
+            # Past market intelligence summary
+            body = ("output:\n"
+                    "  analysis:\n"
+                    f"    - ID: \"000000 - Offline analysis {tag}.\"\n"
+                    f"  summary: \"Offline summary {tag} of the past market intelligence.\"\n")
+
+        return "```yaml\n" + body + "```"
+
+    def create_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str | None = None,
+        temperature: float = 1.0,
+        seed: int | None = 42,
+        max_tokens: int = 4096,
+    ) -> Tuple[str, Dict[str, int]]:
+        """Create a deterministic completion for the given messages."""
+        text, image_urls = self._message_text(messages)
+
+        # Images still feed the hash so different charts give different answers
+        hasher = hashlib.sha256(f"{seed}\n{text}".encode("utf-8"))
+        for image_url in image_urls:
+            hasher.update(image_url.encode("utf-8"))
+        digest = hasher.digest()
+
+        if self.prompt_log_path is not None:
+            self._log_prompt(text, image_urls)
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        response = self._render_response(text, digest)
+
+        # No tokenizer is loaded so the box can stay offline; four characters per token is close enough.
+        # Images are charged a flat estimate instead of the length of their base64 data url.
+        prompt_tokens = len(text) // 4 + len(image_urls) * self.image_tokens
+        completion_tokens = len(response) // 4
+        info = {
+            "prompt_tokens" : prompt_tokens,
+            "completion_tokens" : completion_tokens,
+            "total_tokens" : prompt_tokens + completion_tokens,
+            "offline" : True,
+        }
+
+        return response, info
+
+    def assemble_prompt(self, system_prompts: List[str], user_inputs: List[str], image_filenames: List[str]) -> List[str]:
+        image_urls = [image_data_url(image_path) for image_path in image_filenames]
+
+        messages = [
+            {
+                "role": "system",
+                "content": [{"type": "text", "text": f"{system_prompts[0]}"}]
+            },
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": f"{user_inputs[0]}"}]
+            }
+        ]
+
+        for image_url in image_urls:
+            messages[1]["content"].append(
+                {
+                    "type": "image_url",
+                    "image_url": {"url": image_url}
+                },
+            )
+
+        return messages
@@ -1,5 +1,9 @@
 import os
 import base64
+import mimetypes
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import (
     Any,
     Dict,
@@ -19,6 +23,8 @@ from openai import OpenAI, AzureOpenAI, APIError, RateLimitError, BadRequestErro
 
 from src.registry import PROVIDER
 from src.provider import LLMProvider, EmbeddingProvider
+from src.provider.completion_cache import CompletionCache
+from src.provider.rate_limiter import TokenBucketRateLimiter
 from src.utils import assemble_project_path, load_json
 
 MAX_TOKENS = {
@@ -35,6 +41,14 @@ PROVIDER_SETTING_IS_AZURE = "is_azure"
 PROVIDER_SETTING_BASE_VAR = "base_var"       # Azure-speficic setting
 PROVIDER_SETTING_API_VERSION = "api_version" # Azure-speficic setting
 PROVIDER_SETTING_DEPLOYMENT_MAP = "models"   # Azure-speficic setting
+PROVIDER_SETTING_CACHE_PATH = "cache_path"   # Optional on-disk completion cache
+PROVIDER_SETTING_CACHE_MAX_SIZE_MB = "cache_max_size_mb"
+PROVIDER_SETTING_RPM = "requests_per_minute"   # Optional proactive rate limit
+PROVIDER_SETTING_TPM = "tokens_per_minute"     # Optional proactive rate limit
+PROVIDER_SETTING_RATE_LIMIT_STATE_PATH = "rate_limit_state_path" # Share the rate limit across processes
+
+# Rough prompt cost of one high-detail image, used when estimating request size for the rate limiter
+IMAGE_TOKEN_ESTIMATE = 765
 
 @PROVIDER.register_module(force=True)
 class OpenAIProvider(LLMProvider, EmbeddingProvider):
@@ -50,6 +64,7 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
     embedding_ctx_length: int = 8191
     request_timeout: Optional[Union[float, Tuple[float, float]]] = None
     tiktoken_model_name: Optional[str] = None
+    token_cache_size: int = 4096
 
     """Whether to skip empty strings when embedding or raise an error."""
     skip_empty: bool = False
@@ -65,6 +80,9 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
             None
         """
         self.retries = 5
+        self._encodings = dict()
+        self._token_cache = OrderedDict()
+        self._token_cache_lock = threading.Lock()
         provider_cfg_path = assemble_project_path(provider_cfg_path)
         provider_cfg = load_json(provider_cfg_path)
         self.init_provider(provider_cfg)
@@ -100,10 +118,25 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
         self.embedding_model = config_dict[PROVIDER_SETTING_EMB_MODEL]
         self.llm_model = config_dict[PROVIDER_SETTING_COMP_MODEL]
 
-        try:
-            self.encoding = tiktoken.encoding_for_model(self.llm_model)
-        except KeyError:
-            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = self._get_encoding(self.llm_model)
+
+        self.completion_cache = None
+        if config_dict.get(PROVIDER_SETTING_CACHE_PATH):
+            max_size_mb = config_dict.get(PROVIDER_SETTING_CACHE_MAX_SIZE_MB, 512)
+            self.completion_cache = CompletionCache(
+                cache_path=assemble_project_path(config_dict[PROVIDER_SETTING_CACHE_PATH]),
+                max_size_bytes=int(max_size_mb * 1024 * 1024),
+            )
+
+        self.rate_limiter = None
+        if config_dict.get(PROVIDER_SETTING_RPM) or config_dict.get(PROVIDER_SETTING_TPM):
+            state_path = config_dict.get(PROVIDER_SETTING_RATE_LIMIT_STATE_PATH)
+            self.rate_limiter = TokenBucketRateLimiter(
+                requests_per_minute=config_dict.get(PROVIDER_SETTING_RPM),
+                tokens_per_minute=config_dict.get(PROVIDER_SETTING_TPM),
+                state_path=assemble_project_path(state_path) if state_path else None,
+                name=self.llm_model,
+            )
 
         return config_dict
 
@@ -145,41 +178,102 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
 
         return _embed_with_retry(**kwargs)
 
-    def _get_len_safe_embeddings(
+    def _get_encoding(self, model: str) -> Any:
+        """Return the tiktoken encoding for `model`, loading it only once per provider."""
+        if model not in self._encodings:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                print(f"Warning: model {model} not found. Using cl100k_base encoding to count token numbers.")
+                encoding = tiktoken.get_encoding("cl100k_base")
+            self._encodings[model] = encoding
+        return self._encodings[model]
+
+    def _encode(self, text: str, encoding: Any) -> Tuple[int, ...]:
+        """Tokenize `text`, memoizing the token IDs of recently seen texts.
+
+        The memo is an LRU keyed by the encoding name and a hash of the text, holding at
+        most `token_cache_size` entries.
+        """
+        key = (encoding.name, hashlib.sha1(text.encode("utf-8")).digest())
+
+        with self._token_cache_lock:
+            token = self._token_cache.get(key)
+            if token is not None:
+                self._token_cache.move_to_end(key)
+                return token
+
+        token = tuple(encoding.encode(
+            text,
+            allowed_special=self.allowed_special,
+            disallowed_special=self.disallowed_special,
+        ))
+
+        with self._token_cache_lock:
+            self._token_cache[key] = token
+            if len(self._token_cache) > self.token_cache_size:
+                self._token_cache.popitem(last=False)
+
+        return token
+
+    def _tokenize_for_embedding(
         self,
         texts: List[str],
-    ) -> List[List[float]]:
-        embeddings: List[List[float]] = [[] for _ in range(len(texts))]
-        try:
-            import tiktoken
-        except ImportError:
-            raise ImportError(
-                "Could not import tiktoken python package. "
-                "This is needed in order to for OpenAIEmbeddings. "
-                "Please install it with `pip install tiktoken`."
-            )
+    ) -> Tuple[List[List[int]], List[int]]:
+        """Split each text into token chunks no longer than the embedding context.
 
+        Returns:
+            The token chunks and, for each chunk, the index of the text it came from.
+        """
         tokens = []
         indices = []
         model_name = self.tiktoken_model_name or self.embedding_model
-        
-        try:
-            encoding = tiktoken.encoding_for_model(model_name)
-        except KeyError:
-            print("Warning: model not found. Using cl100k_base encoding to count token numbers.")
-            model = "cl100k_base"
-            encoding = tiktoken.get_encoding(model)
+        encoding = self._get_encoding(model_name)
             
         for i, text in enumerate(texts):
-            token = encoding.encode(
-                text,
-                allowed_special=self.allowed_special,
-                disallowed_special=self.disallowed_special,
-            )
+            token = self._encode(text, encoding)
             for j in range(0, len(token), self.embedding_ctx_length):
-                tokens.append(token[j : j + self.embedding_ctx_length])
+                tokens.append(list(token[j : j + self.embedding_ctx_length]))
                 indices.append(i)
 
+        return tokens, indices
+
+    def _combine_chunk_embeddings(
+        self,
+        num_texts: int,
+        tokens: List[List[int]],
+        indices: List[int],
+        batched_embeddings: List[List[float]],
+    ) -> List[Optional[List[float]]]:
+        """Average the chunk embeddings of each text weighted by chunk length.
+
+        Texts without any usable chunk are returned as None so the caller can
+        fill them with the embedding of the empty string.
+        """
+        results: List[List[List[float]]] = [[] for _ in range(num_texts)]
+        num_tokens_in_batch: List[List[int]] = [[] for _ in range(num_texts)]
+        for i in range(len(indices)):
+            if self.skip_empty and len(batched_embeddings[i]) == 1:
+                continue
+            results[indices[i]].append(batched_embeddings[i])
+            num_tokens_in_batch[indices[i]].append(len(tokens[i]))
+
+        embeddings: List[Optional[List[float]]] = [None for _ in range(num_texts)]
+        for i in range(num_texts):
+            _result = results[i]
+            if len(_result) == 0:
+                continue
+            average = np.average(_result, axis=0, weights=num_tokens_in_batch[i])
+            embeddings[i] = (average / np.linalg.norm(average)).tolist()
+
+        return embeddings
+
+    def _get_len_safe_embeddings(
+        self,
+        texts: List[str],
+    ) -> List[List[float]]:
+        tokens, indices = self._tokenize_for_embedding(texts)
+
         batched_embeddings: List[List[float]] = []
         _chunk_size = self.chunk_size
         _iter = range(0, len(tokens), _chunk_size)
@@ -191,24 +285,15 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
             )
             batched_embeddings.extend(r.embedding for r in response.data)
 
-        results: List[List[List[float]]] = [[] for _ in range(len(texts))]
-        num_tokens_in_batch: List[List[int]] = [[] for _ in range(len(texts))]
-        for i in range(len(indices)):
-            if self.skip_empty and len(batched_embeddings[i]) == 1:
-                continue
-            results[indices[i]].append(batched_embeddings[i])
-            num_tokens_in_batch[indices[i]].append(len(tokens[i]))
+        embeddings = self._combine_chunk_embeddings(len(texts), tokens, indices, batched_embeddings)
 
         for i in range(len(texts)):
-            _result = results[i]
-            if len(_result) == 0:
-                average = self.embed_with_retry(
+            if embeddings[i] is None:
+                average = np.asarray(self.embed_with_retry(
                     input="",
                     **self._emb_invocation_params,
-                ).data[0].embedding
-            else:
-                average = np.average(_result, axis=0, weights=num_tokens_in_batch[i])
-            embeddings[i] = (average / np.linalg.norm(average)).tolist()
+                ).data[0].embedding)
+                embeddings[i] = (average / np.linalg.norm(average)).tolist()
 
         return embeddings
 
@@ -291,6 +376,18 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
         if model is None:
             model = self.llm_model
 
+        cache_key = None
+        if self.completion_cache is not None:
+            cache_key = self.completion_cache.make_key(messages, model, temperature, seed, max_tokens)
+            cached = self.completion_cache.get(cache_key)
+            if cached is not None:
+                message, info = cached
+                return message, dict(info, cached=True)
+
+        prompt_tokens_estimate = 0
+        if self.rate_limiter is not None:
+            prompt_tokens_estimate = self.estimate_prompt_tokens(messages, model)
+
         @backoff.on_exception(
             backoff.constant,
             (
@@ -310,34 +407,20 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
             
             """Send a request to the OpenAI API."""
 
-            if self.provider_cfg[PROVIDER_SETTING_IS_AZURE]:
-                response = self.client.chat.completions.create(deployment_id=self.get_azure_deployment_id_for_model(model),
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                seed=seed,
-                max_tokens=max_tokens,)
-            else:
-                response = self.client.chat.completions.create(model=model,
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(prompt_tokens_estimate + max_tokens)
+
+            response = self.client.chat.completions.create(
+                **self._comp_invocation_params(model),
                 messages=messages,
                 temperature=temperature,
                 seed=seed,
-                max_tokens=max_tokens,)
-
-            if response is None:
-                print("Failed to get a response from OpenAI. Try again.")
-
-            message = response.choices[0].message.content
-
-            info = {
-                "prompt_tokens" : response.usage.prompt_tokens, 
-                "completion_tokens" : response.usage.completion_tokens, 
-                "total_tokens" : response.usage.total_tokens,
-            }
+                max_tokens=max_tokens,
+            )
 
-            return message, info
+            return self._parse_completion_response(response)
 
-        return _generate_response_with_retry(
+        message, info = _generate_response_with_retry(
             messages,
             model,
             temperature,
@@ -345,6 +428,74 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
             max_tokens,
         )
 
+        if self.rate_limiter is not None:
+            self.rate_limiter.reconcile(prompt_tokens_estimate, info["prompt_tokens"])
+
+        if cache_key is not None:
+            self.completion_cache.set(cache_key, message, info)
+
+        return message, info
+
+    def count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        """Count the tokens of a text with the encoding of `model` (the completion model by default)."""
+        encoding = self._get_encoding(self.llm_model if model is None else model)
+        return len(self._encode(text, encoding))
+
+    def truncate_to_tokens(self, text: str, max_tokens: int, model: Optional[str] = None) -> str:
+        """Cut a text down to its first max_tokens tokens, splitting at a token boundary."""
+        encoding = self._get_encoding(self.llm_model if model is None else model)
+        token = self._encode(text, encoding)
+        if len(token) <= max_tokens:
+            return text
+        return encoding.decode(list(token[:max_tokens]))
+
+    def estimate_prompt_tokens(self, messages, model = None) -> int:
+        """Estimate the prompt size of a request before sending it.
+
+        Falls back to counting the text with the provider encoding when the exact per-message
+        overhead of `model` is unknown, and charges a fixed estimate for every image.
+        """
+        try:
+            num_tokens = self.num_tokens_from_messages(messages, model=model)
+        except (NotImplementedError, ValueError):
+            num_tokens = 3
+            for message in messages:
+                num_tokens += 3
+                for content in message.get("content", []):
+                    if isinstance(content, dict) and content.get("type") == "text":
+                        num_tokens += len(self._encode(content["text"], self.encoding))
+
+        for message in messages:
+            for content in message.get("content", []):
+                if isinstance(content, dict) and content.get("type") == "image_url":
+                    num_tokens += IMAGE_TOKEN_ESTIMATE
+
+        return num_tokens
+
+    def _comp_invocation_params(self, model: str) -> Dict:
+        """Model arguments for a chat completion request.
+
+        Azure addresses chat models by their deployment name rather than the model label.
+        """
+        if self.provider_cfg[PROVIDER_SETTING_IS_AZURE]:
+            return {"model": self._get_azure_deployment_id_for_model(model)}
+        return {"model": model}
+
+    def _parse_completion_response(self, response: Any) -> Tuple[str, Dict[str, int]]:
+        """Extract the message text and token usage from a chat completion response."""
+        if response is None:
+            print("Failed to get a response from OpenAI. Try again.")
+
+        message = response.choices[0].message.content
+
+        info = {
+            "prompt_tokens" : response.usage.prompt_tokens, 
+            "completion_tokens" : response.usage.completion_tokens, 
+            "total_tokens" : response.usage.total_tokens,
+        }
+
+        return message, info
+
     def num_tokens_from_messages(self, messages, model = None) -> int:
         """Return the number of tokens used by a list of messages.
         Borrowed from https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
@@ -352,10 +503,7 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
 
         model = self.provider_cfg[PROVIDER_SETTING_COMP_MODEL] if model is None else model
 
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
+        encoding = self._get_encoding(model)
 
         if model in {
             "gpt-4-1106-vision-preview",
@@ -394,7 +542,7 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
                 if key == "content":
                     for content in value:
                         if content["type"] == "text":
-                            num_tokens += len(encoding.encode(content["text"]))
+                            num_tokens += len(self._encode(content["text"], encoding))
                 if key == "name":
                     num_tokens += tokens_per_name
 
@@ -406,7 +554,7 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
         return self.provider_cfg[PROVIDER_SETTING_DEPLOYMENT_MAP][model_label]
 
     def assemble_prompt(self, system_prompts: List[str], user_inputs: List[str], image_filenames: List[str]) -> List[str]:
-        encoded_images = [encode_image(image_path) for image_path in image_filenames]
+        image_urls = [image_data_url(image_path) for image_path in image_filenames]
 
         messages = [
             {
@@ -436,13 +584,13 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
             }
         ]
 
-        for image in encoded_images:
+        for image_url in image_urls:
             messages[1]["content"].append(
                 {
                     "type": "image_url",
                     "image_url":
                         {
-                            "url": f"data:image/jpeg;base64,{image}"
+                            "url": image_url
                         }
                 },
             )
@@ -451,4 +599,12 @@ class OpenAIProvider(LLMProvider, EmbeddingProvider):
 
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
\ No newline at end of file
+        return base64.b64encode(image_file.read()).decode('utf-8')
+
+def image_mime_type(image_path):
+    mime_type, _ = mimetypes.guess_type(image_path)
+    return mime_type if mime_type is not None else "image/png"
+
+def image_data_url(image_path):
+    '''Data URL of an image file, labelled with the MIME type of its extension.'''
+    return f"data:{image_mime_type(image_path)};base64,{encode_image(image_path)}"
\ No newline at end of file
@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import (
+    Optional,
+    Tuple,
+)
+
+class TokenBucketRateLimiter():
+    """Proactive requests-per-minute and tokens-per-minute limiter.
+
+    Two token buckets refill continuously at `requests_per_minute / 60` and
+    `tokens_per_minute / 60` per second. A call may proceed once both buckets hold
+    enough budget for it, so bursts are allowed up to one minute of quota and the
+    sustained rate never exceeds it.
+
+    Without a `state_path` the buckets live in this process. With one, they are kept
+    in a SQLite file and updated inside write transactions, so every process that
+    points at the same file draws from a single shared quota.
+    """
+
+    def __init__(self,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 state_path: Optional[str] = None,
+                 name: str = "default") -> None:
+        """
+        Args:
+            requests_per_minute: Request quota, or None to leave requests unlimited.
+            tokens_per_minute: Token quota, or None to leave tokens unlimited.
+            state_path: Optional SQLite file used to share the buckets across processes.
+            name: Bucket name, so several quotas (e.g. per model) can share one file.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.state_path = state_path
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._state = (float(requests_per_minute or 0), float(tokens_per_minute or 0), time.time())
+
+        if state_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+            self._conn = sqlite3.connect(state_path,
+                                         timeout=30,
+                                         check_same_thread=False,
+                                         isolation_level=None)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, "
+                "requests REAL NOT NULL, "
+                "tokens REAL NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, requests, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                (name, *self._state),
+            )
+
+    def _refill(self, requests: float, tokens: float, updated_at: float, now: float) -> Tuple[float, float]:
+        elapsed = max(now - updated_at, 0.0)
+        if self.requests_per_minute:
+            requests = min(requests + elapsed * self.requests_per_minute / 60.0, self.requests_per_minute)
+        if self.tokens_per_minute:
+            tokens = min(tokens + elapsed * self.tokens_per_minute / 60.0, self.tokens_per_minute)
+        return requests, tokens
+
+    def _take(self, requests: float, tokens: float, num_tokens: int) -> Tuple[float, float, float]:
+        """Try to draw one request and `num_tokens` tokens.
+
+        Returns:
+            The new bucket levels and the number of seconds to wait (0 if the draw succeeded).
+        """
+        # A single call larger than the whole bucket could never proceed, so it only has to wait for a full bucket
+        if self.tokens_per_minute:
+            num_tokens = min(num_tokens, self.tokens_per_minute)
+
+        wait = 0.0
+        if self.requests_per_minute and requests < 1:
+            wait = max(wait, (1 - requests) * 60.0 / self.requests_per_minute)
+        if self.tokens_per_minute and tokens < num_tokens:
+            wait = max(wait, (num_tokens - tokens) * 60.0 / self.tokens_per_minute)
+
+        if wait > 0:
+            return requests, tokens, wait
+        return requests - 1, tokens - num_tokens, 0.0
+
+    def _update(self, fn) -> float:
+        """Apply `fn(requests, tokens) -> (requests, tokens, wait)` to the refilled buckets atomically."""
+        with self._lock:
+            now = time.time()
+            if self._conn is None:
+                requests, tokens = self._refill(*self._state, now)
+                requests, tokens, wait = fn(requests, tokens)
+                self._state = (requests, tokens, now)
+                return wait
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, tokens, updated_at = self._conn.execute(
+                    "SELECT requests, tokens, updated_at FROM buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                requests, tokens = self._refill(requests, tokens, updated_at, now)
+                requests, tokens, wait = fn(requests, tokens)
+                self._conn.execute(
+                    "UPDATE buckets SET requests = ?, tokens = ?, updated_at = ? WHERE name = ?",
+                    (requests, tokens, now, self.name),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return wait
+
+    def try_acquire(self, num_tokens: int = 0) -> float:
+        """Draw budget for one call if available.
+
+        Returns:
+            0 if the call may proceed now, otherwise the seconds to wait before retrying.
+        """
+        return self._update(lambda requests, tokens: self._take(requests, tokens, num_tokens))
+
+    def acquire(self, num_tokens: int = 0) -> None:
+        """Block until one request and `num_tokens` tokens are available, then draw them."""
+        while True:
+            wait = self.try_acquire(num_tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, num_tokens: int = 0) -> None:
+        """Async counterpart of `acquire` that yields to the event loop while waiting."""
+        while True:
+            wait = self.try_acquire(num_tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Charge the token bucket for usage beyond the estimate once a call has finished.
+
+        Unused budget is not refunded, because the API already counts the requested
+        `max_tokens` against the quota when the call is admitted.
+        """
+        if not self.tokens_per_minute or actual_tokens <= estimated_tokens:
+            return
+        delta = estimated_tokens - actual_tokens
+        self._update(lambda requests, tokens: (requests, min(tokens + delta, self.tokens_per_minute), 0.0))
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import json
+from pathlib import Path
+import argparse
+
+from src.fetchers.mock_server import MockMarketServer
+from src.fetchers.prices import CCXTPriceFetcher
+from src.fetchers.news import FMPCryptoNewsFetcher
+
+root = str(Path(__file__).resolve().parents[0])
+sys.path.append(root)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the price and news fetchers against a local mock server")
+    parser.add_argument("--num_symbols", type=int, default=20)
+    parser.add_argument("--price_workers", type=int, default=8)
+    parser.add_argument("--news_workers", type=int, default=5)
+    parser.add_argument("--exchange_rate_limit", type=int, default=50, help="Milliseconds between exchange requests.")
+    parser.add_argument("--news_calls_per_minute", type=int, default=250)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--rate_limit_requests", type=int, default=None)
+    parser.add_argument("--rate_limit_window", type=float, default=1.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Configuration
+    workdir = "workdir"
+    tag = "mock_benchmark"
+    start_date = "2023-06-09"
+    end_date = "2025-01-03"
+    interval = "1d"
+
+    # Synthetic universe, written next to the downloads
+    cryptos_path = os.path.join(workdir, "mock_cryptos.txt")
+    os.makedirs(os.path.join(root, workdir), exist_ok=True)
+    with open(os.path.join(root, cryptos_path), "w") as op:
+        op.write("\n".join("MOCK{:03d}-USDT".format(i) for i in range(args.num_symbols)))
+
+    server = MockMarketServer(port=0,
+                              latency=args.latency,
+                              jitter=args.jitter,
+                              rate_limit_requests=args.rate_limit_requests,
+                              rate_limit_window=args.rate_limit_window,
+                              error_rate=args.error_rate,
+                              seed=args.seed,
+                              now=end_date,
+                              news_start_date=start_date,
+                              news_per_day=4)
+
+    with server:
+        print(f"| Mock server on {server.url}")
+
+        fetcher = CCXTPriceFetcher(
+            root=root,
+            exchange_name="mock",
+            start_date=start_date,
+            end_date=end_date,
+            interval=interval,
+            cryptos_path=cryptos_path,
+            workdir=workdir,
+            tag=f"{tag}_prices",
+            limit=100,
+            max_workers=args.price_workers,
+            exchange_config={
+                "urls": {"api": {"public": server.url}},
+                "rateLimit": args.exchange_rate_limit,
+                "options": {"maxRetriesOnFailure": 3, "maxRetriesOnFailureDelay": 500},
+            },
+        )
+        price_report = fetcher.fetch_all()
+
+        downloader = FMPCryptoNewsFetcher(
+            root=root,
+            api_key="mock",
+            start_date=start_date,
+            end_date=end_date,
+            interval=interval,
+            max_pages=1000,
+            cryptos_path=cryptos_path,
+            workdir=workdir,
+            tag=f"{tag}_news",
+            max_workers=args.news_workers,
+            calls_per_minute=args.news_calls_per_minute,
+            base_url=server.url,
+        )
+        start_time = time.time()
+        downloader.download()
+        news_seconds = time.time() - start_time
+
+        print("| Prices:", json.dumps(price_report))
+        print(f"| News: {len(downloader.cryptos)} symbols in {news_seconds:.1f}s")
+        print("| Server:", json.dumps(server.stats))
+
+if __name__ == '__main__':
+    main()
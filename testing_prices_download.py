@@ -33,10 +33,11 @@ def main():
         workdir=workdir,
         tag=tag,
         limit=150000,
-        delay=1.0
+        delay=1.0,
+        max_workers=4
     )
 
-    # Fetch the data for all cryptos (here just BTC/USDT)
+    # Fetch the data for all cryptos (here just BTC/USDT), several symbols at a time
     fetcher.fetch_all()
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import tiktoken
+
+from src.provider.async_provider import AsyncOpenAIProvider
+
+COMPLETION = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o",
+    "choices": [{
+        "index": 0,
+        "finish_reason": "stop",
+        "message": {"role": "assistant", "content": "ok"},
+    }],
+    "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+}
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the client pools its connections like it does against the real API
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps(COMPLETION).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def provider(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CompletionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setenv("OA_OPENAI_KEY", "test")
+    # Completions without a rate limiter never tokenize, so no tiktoken encoding has to be downloaded
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: None)
+
+    yield AsyncOpenAIProvider(provider_cfg_path="configs/provider_configs/openai_config.json")
+
+    server.shutdown()
+    server.server_close()
+
+async def complete(provider):
+    message, info = await provider.acreate_completion(messages=[{"role": "user", "content": "hi"}])
+    return message, provider.async_client
+
+def test_asyncio_run_twice_closes_the_previous_client(provider):
+    first_message, first_client = asyncio.run(complete(provider))
+    assert first_message == "ok"
+    assert first_client.is_closed()
+    assert provider.async_client is None
+
+    second_message, second_client = asyncio.run(complete(provider))
+    assert second_message == "ok"
+    assert second_client is not first_client
+    assert second_client.is_closed()
+
+def test_aclose_releases_the_client(provider):
+    async def complete_and_close():
+        message, client = await complete(provider)
+        await provider.aclose()
+        return client
+
+    client = asyncio.run(complete_and_close())
+    assert client.is_closed()
+    assert provider.async_client is None
+
+    message, _ = asyncio.run(complete(provider))
+    assert message == "ok"
+
+def test_open_client_is_not_reused_on_another_loop(provider):
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(complete(provider))
+        with pytest.raises(RuntimeError):
+            asyncio.run(complete(provider))
+        loop.run_until_complete(provider.aclose())
+    finally:
+        loop.close()
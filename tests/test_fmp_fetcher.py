@@ -0,0 +1,54 @@
+import math
+
+import pandas as pd
+import pytest
+
+from src.fetchers.mock_server import MockMarketServer
+from src.fetchers.news import FMPCryptoNewsFetcher
+
+START_DATE = "2024-01-01"
+END_DATE = "2024-01-10"
+NEWS_PER_DAY = 7
+PAGE_SIZE = 20
+
+# 70 articles, so the last of the 4 pages is short
+NUM_ARTICLES = 10 * NEWS_PER_DAY
+NUM_PAGES = math.ceil(NUM_ARTICLES / PAGE_SIZE)
+
+@pytest.fixture
+def server():
+    with MockMarketServer(port=0,
+                          now="2024-01-11",
+                          news_start_date=START_DATE,
+                          news_per_day=NEWS_PER_DAY,
+                          page_size=PAGE_SIZE) as server:
+        yield server
+
+def download(server, tmp_path, max_workers):
+    (tmp_path / "cryptos.txt").write_text("BTC-USDT\n")
+    fetcher = FMPCryptoNewsFetcher(root=str(tmp_path),
+                                   api_key="test",
+                                   start_date=START_DATE,
+                                   end_date=END_DATE,
+                                   cryptos_path="cryptos.txt",
+                                   workdir="news",
+                                   tag=f"workers{max_workers}",
+                                   max_workers=max_workers,
+                                   calls_per_minute=60000,
+                                   base_url=server.url)
+    fetcher.download()
+    return pd.read_csv(tmp_path / "news" / f"workers{max_workers}" / "BTC-USDT.csv")
+
+def test_serial_download_stops_at_the_short_page(server, tmp_path):
+    news = download(server, tmp_path, max_workers=1)
+
+    assert len(news) == NUM_ARTICLES
+    assert server.stats["news"] == NUM_PAGES
+
+def test_concurrent_download_only_overshoots_by_the_pages_in_flight(server, tmp_path):
+    max_workers = 4
+    news = download(server, tmp_path, max_workers=max_workers)
+
+    assert len(news) == NUM_ARTICLES
+    assert news["url"].is_unique
+    assert NUM_PAGES <= server.stats["news"] <= NUM_PAGES + max_workers - 1
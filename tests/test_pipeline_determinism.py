@@ -0,0 +1,91 @@
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pandas_ta")
+
+ROOT = Path(__file__).resolve().parents[1]
+SCRIPT = ROOT / "training" / "train-w-mi-w-low.py"
+
+WORDS = ["bitcoin", "price", "rally", "dump", "etf", "sec", "miners", "halving"]
+
+def write_dataset(data_dir: Path) -> None:
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2023-06-01", "2023-07-31", freq="D")
+
+    price_dir = data_dir / "price"
+    news_dir = data_dir / "news"
+    price_dir.mkdir(parents=True)
+    news_dir.mkdir(parents=True)
+
+    open_prices = rng.uniform(100, 200, len(dates))
+    high_prices = open_prices + rng.uniform(0, 20, len(dates))
+    low_prices = open_prices - rng.uniform(0, 20, len(dates))
+    close_prices = low_prices + rng.uniform(0, 1, len(dates)) * (high_prices - low_prices)
+    pd.DataFrame({
+        "timestamp": dates.strftime("%Y-%m-%d %H:%M:%S"),
+        "open": open_prices,
+        "high": high_prices,
+        "low": low_prices,
+        "close": close_prices,
+        "volume": rng.uniform(1000, 10000, len(dates)),
+    }).to_csv(price_dir / "BTC-USDT_1d.csv", index=False)
+
+    # Several articles a day, so a step adds many memories within the same second
+    rows = []
+    for date in dates:
+        for k in range(int(rng.integers(1, 6))):
+            rows.append({
+                "timestamp": (date + pd.Timedelta(hours=k)).strftime("%Y-%m-%d %H:%M:%S"),
+                "title": f"Bitcoin news {date.date()} #{k}",
+                "image": f"https://example.com/{date.date()}/{k}.png",
+                "site": "example.com",
+                "text": " ".join(rng.choice(WORDS, size=200)),
+                "url": f"https://example.com/{date.date()}/{k}",
+            })
+    pd.DataFrame(rows).to_csv(news_dir / "BTC-USDT.csv", index=False)
+
+def run_training(tmp_path: Path, name: str, options: list) -> list:
+    workdir = tmp_path / name
+    prompt_log_path = workdir / "prompts.jsonl"
+    subprocess.run([
+        sys.executable, str(SCRIPT), "--if_remove",
+        "--cfg-options",
+        "provider.type=OfflineProvider",
+        "provider.provider_cfg_path=configs/provider_configs/offline_config.json",
+        f"provider.prompt_log_path={prompt_log_path}",
+        f"dataset.price_path={tmp_path / 'data' / 'price'}",
+        f"dataset.news_path={tmp_path / 'data' / 'news'}",
+        f"dataset.workdir={workdir}",
+        f"plots.workdir={workdir}",
+        f"memory.workdir={workdir}",
+        f"workdir={workdir}",
+        "train_environment.start_date=2023-07-01",
+        "train_environment.end_date=2023-07-10",
+        "valid_environment.start_date=2023-07-11",
+        "valid_environment.end_date=2023-07-15",
+        *options,
+    ], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+
+    with open(prompt_log_path) as op:
+        return [json.loads(line) for line in op]
+
+def test_serial_and_concurrent_runs_send_the_same_prompts(tmp_path):
+    write_dataset(tmp_path / "data")
+
+    serial = run_training(tmp_path, "serial", ["stage_workers=1",
+                                               "prefetch_next_step=False",
+                                               "prerender_klines=False"])
+    concurrent = run_training(tmp_path, "concurrent", ["stage_workers=4",
+                                                       "prefetch_next_step=True",
+                                                       "prerender_klines=True"])
+
+    # Independent stages finish in any order, so only the set of prompts has to match
+    key = lambda record: (record["text"], record["images"])
+    assert len(serial) > 0
+    assert sorted(serial, key=key) == sorted(concurrent, key=key)
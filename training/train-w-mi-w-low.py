@@ -17,6 +17,9 @@ from src.asset import ASSET
 from src.utils import read_resource_file, save_json, load_json
 from src.utils.misc import update_data_root
 from src.query.diverse_query import DiverseQuery
+from src.metrics import UsageTracker
+from src.pipeline import Stage, StageScheduler, StepPrefetcher
+from src.prompt import PromptPipeline
 from src.prompt.helpers import (prepare_latest_market_intelligence_params,
                              prepare_low_level_reflection_params)
 from src.registry import *
@@ -109,6 +112,11 @@ def main():
 
     # Initialize provider and training dataset
     provider = PROVIDER.build(cfg.provider)
+    # Memory embeddings can come from a separate (e.g. local) provider, otherwise the LLM provider embeds too
+    if cfg.get("embedding_provider") is not None:
+        embedding_provider = PROVIDER.build(cfg.embedding_provider)
+    else:
+        embedding_provider = provider
     dataset = DATASET.build(cfg.dataset)
     
     # Initialize trading environment
@@ -120,7 +128,7 @@ def main():
     # Init plots and memory
     plots = PLOTS.build(cfg.plots)
     cfg.memory["symbols"] = dataset.assets
-    cfg.memory["embedding_dim"] = provider.get_embedding_dim()
+    cfg.memory["embedding_dim"] = embedding_provider.get_embedding_dim()
     memory = MEMORY.build(cfg.memory)
     
     if cfg.memory_path is not None:
@@ -133,11 +141,12 @@ def main():
     
     # Setup diverse query system and strategy agents if need be
     diverse_query = DiverseQuery(memory=memory, 
-                                 provider=provider, 
+                                 provider=embedding_provider, 
                                  top_k=cfg.top_k)
     
     # Train
     if cfg.if_train:
+        train_usage = UsageTracker()
         train_records = run(cfg,
                             train_env,
                             plots,
@@ -145,14 +154,18 @@ def main():
                             provider,
                             diverse_query,
                             experiment_path,
-                            mode = "train")
+                            mode = "train",
+                            usage_tracker = train_usage,
+                            embedding_provider = embedding_provider)
         train_save_path = os.path.join(experiment_path, "train_records.json")
 
         memory.save_local(memory_path=memory_path)
         save_json(train_records, train_save_path)
+        train_usage.save(os.path.join(experiment_path, "train_usage.json"))
     
     # Validate
     if cfg.if_valid:
+        valid_usage = UsageTracker()
         valid_records = run(cfg,
                             valid_env,
                             plots,
@@ -160,9 +173,12 @@ def main():
                             provider,
                             diverse_query,
                             experiment_path,
-                            mode = "valid")
+                            mode = "valid",
+                            usage_tracker = valid_usage,
+                            embedding_provider = embedding_provider)
         valid_save_path = os.path.join(experiment_path, "valid_records.json")
         save_json(valid_records, valid_save_path)
+        valid_usage.save(os.path.join(experiment_path, "valid_usage.json"))
     
 def run(cfg, 
         env, 
@@ -171,7 +187,9 @@ def run(cfg,
         provider, 
         diverse_query,
         experiment_path,
-        mode = "train"):
+        mode = "train",
+        usage_tracker = None,
+        embedding_provider = None):
     
     # Grab or make trading records directory and memory records
     trading_records_path = os.path.join(experiment_path, "trading_records")
@@ -214,7 +232,38 @@ def run(cfg,
             else:
                 break
     
+    # Parse the prompt templates of this mode once for the whole run
+    prompts = PromptPipeline(cfg, mode=mode)
+    
+    # Optionally queue the kline charts of every remaining day up front, steps then only collect them
+    if cfg.get("prerender_klines", False):
+        plots.prerender_klines(env,
+                               save_dir="train" if mode == "train" else "valid",
+                               mode=mode,
+                               days=range(info["day"], env.end_day))
+    
+    # Optionally prepare the next day's inputs in the background while the LLM works on the current day
+    prefetcher = None
+    if cfg.get("prefetch_next_step", False):
+        prefetcher = StepPrefetcher()
+    
     while True:
+        prefetched = None
+        if prefetcher is not None:
+            prefetched = prefetcher.pop(info["day"])
+            if prefetched is not None and prefetched["date"] != info["date"]:
+                prefetched = None
+            
+            if info["day"] + 1 < env.end_day:
+                prefetcher.submit(info["day"] + 1,
+                                  prepare_step_inputs,
+                                  env,
+                                  info["day"] + 1,
+                                  plots,
+                                  prompts,
+                                  provider,
+                                  mode)
+        
         action = run_step(cfg,
                           state,
                           info,
@@ -224,7 +273,11 @@ def run(cfg,
                           diverse_query,
                           experiment_path,
                           trading_records,
-                          mode)
+                          mode,
+                          usage_tracker,
+                          embedding_provider,
+                          prefetched,
+                          prompts)
         
         assert action in env.action_map.keys(), f"Action {action} is not in the action map {env.action_map.keys()}"
 
@@ -245,11 +298,45 @@ def run(cfg,
             trading_records["price"].append(info["price"])
             break
         
-        # Save trading records
+        # Save trading records and LLM usage so far
         save_json(trading_records, os.path.join(trading_records_path, f"trading_records_{str(info['date'])}.json"))
+        if usage_tracker is not None:
+            usage_tracker.save(os.path.join(experiment_path, f"{mode}_usage.json"))
+
+    if prefetcher is not None:
+        prefetcher.close()
+    plots.flush()
 
     return trading_records
 
+def prepare_step_inputs(env, day, plots, prompts, provider, mode):
+    '''Builds the inputs of a step that do not depend on the LLM: the state window, the kline chart
+    and the prompt params that only depend on the day's data.'''
+    save_dir = "train" if mode == "train" else "valid"
+    
+    state = env.get_state(day=day)
+    info = {
+        "symbol": str(env.symbol),
+        "date": env.get_current_date(day=day).strftime('%Y-%m-%d'),
+    }
+    
+    kline_image = plots.render_kline(state=state,
+                                     info=info,
+                                     save_dir=save_dir,
+                                     mode=mode)
+    params = {
+        "kline_image": kline_image,
+        "kline_path": kline_image.path if kline_image is not None else None,
+    }
+    params.update(prompts.prepare_params(state=state,
+                                         info=info,
+                                         provider=provider))
+    
+    return {
+        "date": info["date"],
+        "params": params,
+    }
+
 def run_step(cfg,
              state,
              info,
@@ -259,107 +346,40 @@ def run_step(cfg,
              diverse_query,
              experiment_path,
              trading_records,
-             mode):
+             mode,
+             usage_tracker = None,
+             embedding_provider = None,
+             prefetched = None,
+             prompts = None):
     
     # TODO
     # 1) issues with updating trading records during training
     
+    if embedding_provider is None:
+        embedding_provider = provider
+    
     params = dict()
+    results = dict()
     save_dir = "train" if mode == "train" else "valid"
     
-    # plot kline chart
-    kline_path = plots.plot_kline(state=state,
-                                  info=info,
-                                  save_dir=save_dir,
-                                  mode=mode)
-    params.update({
-        "kline_path":kline_path
-    })
-    
-    # Latest market intelligence
-    lmi_summary_template_path = (cfg.train_latest_market_intelligence_summary_template_path 
-                                 if mode == "train" 
-                                 else cfg.valid_latest_market_intelligence_summary_template_path)
-    cfg.latest_market_intelligence_summary["template_path"] = lmi_summary_template_path
-    lmi_summary = PROMPT.build(cfg.latest_market_intelligence_summary)
-    lmi_result = lmi_summary.run(state=state,
-                                 info=info,
-                                 params=params,
-                                 memory=memory,
-                                 provider=provider,
-                                 diverse_query=diverse_query,
-                                 exp_path=experiment_path,
-                                 save_dir=save_dir,)
+    # Inputs prepared ahead of time, their stages are skipped
+    if prefetched is not None:
+        params.update(prefetched["params"])
     
-    # Past latest market intelligence
-    prepared_latest_market_intelligence_params = prepare_latest_market_intelligence_params(state=state,
-                                                                                           info=info,
-                                                                                           params=params,
-                                                                                           memory=memory,
-                                                                                           provider=provider,
-                                                                                           diverse_query=diverse_query)
-    params.update(prepared_latest_market_intelligence_params)
-    
-    # Past market intelligence
-    pmi_summary_template_path = (cfg.train_past_market_intelligence_summary_template_path 
-                                 if mode == "train" 
-                                 else cfg.valid_past_market_intelligence_summary_template_path)
-    cfg.past_market_intelligence_summary["template_path"] = pmi_summary_template_path
-    pmi_summary = PROMPT.build(cfg.past_market_intelligence_summary)
-    pmi_result = pmi_summary.run(state=state,
-                                 info=info,
-                                 params=params,
-                                 memory=memory,
-                                 provider=provider,
-                                 diverse_query=diverse_query,
-                                 exp_path=experiment_path,
-                                 save_dir=save_dir,)
-    
-    # Save latest market intelligence to memory
-    lmi_summary.add_to_memory(state=state,
-                              info=info,
-                              result=lmi_result,
-                              memory=memory,
-                              provider=provider)
-    
-    # Low Level Reflection 
-    llr_template_path = (cfg.train_low_level_reflection_template_path 
-                                 if mode == "train" 
-                                 else cfg.valid_low_level_reflection_template_path)
-    cfg.low_level_reflection["template_path"] = llr_template_path
-    low_level_reflection = PROMPT.build(cfg.low_level_reflection)
-    low_level_reflection_result = low_level_reflection.run(state=state,
-                                                           info=info,
-                                                           params=params,
-                                                           memory=memory,
-                                                           provider=provider,
-                                                           diverse_query=diverse_query,
-                                                           exp_path=experiment_path,
-                                                           save_dir=save_dir)
+    # Prompts are normally built once per run
+    if prompts is None:
+        prompts = PromptPipeline(cfg, mode=mode)
+    lmi_summary = prompts["latest_market_intelligence_summary"]
+    pmi_summary = prompts["past_market_intelligence_summary"]
+    low_level_reflection = prompts["low_level_reflection"]
+    decision_prompt = prompts["decision"]
     
-    # Prepare past low level reflection params
-    prepared_low_level_reflection_params = prepare_low_level_reflection_params(state=state,
-                                                                               info=info,
-                                                                               params=params,
-                                                                               memory=memory,
-                                                                               provider=provider,
-                                                                               diverse_query=diverse_query)
-    params.update(prepared_low_level_reflection_params)
-    
-    # Store low level reflection in memory system
-    low_level_reflection.add_to_memory(state=state,
-                                       info=info,
-                                       res=low_level_reflection_result,
-                                       memory=memory,
-                                       provider=provider)
-    
-    # Plot trading chart
-    #if len(trading_records["date"]) <= 0:
+    # Plot trading chart, the chart only appends the records added since the last step
     trading_path = None
-    # else:
-    #     trading_path = plots.plot_trading(records=trading_records,
-    #                                       info=info,
-    #                                       save_dir=save_dir)
+    if cfg.get("plot_trading_chart", False) and len(trading_records["date"]) > 0:
+        trading_path = plots.plot_trading(records=trading_records,
+                                          info=info,
+                                          save_dir=save_dir)
     params.update({
         "trading_path": trading_path
     })
@@ -376,20 +396,109 @@ def run_step(cfg,
         }
     params.update(trader_preference)
     
-    # Decision Making
-    decision_template_path = (cfg.train_decision_template_path 
-                              if mode == "train"
-                              else cfg.valid_decision_template_path)
-    cfg.decision["template_path"] = decision_template_path
-    decision_prompt = PROMPT.build(cfg.decision)
-    decision_result = decision_prompt.run(state=state,
-                                            info=info,
-                                            params=params,
-                                            memory=memory,
-                                            provider=provider,
-                                            diverse_query=diverse_query,
-                                            exp_path=experiment_path,
-                                            save_dir=save_dir)
+    def new_params(snapshot, updated):
+        # Stages only ever add params, so the new keys are the stage outputs
+        return {key: value for key, value in updated.items() if key not in snapshot}
+    
+    def prompt_stage(name, prompt):
+        def fn(snapshot):
+            stage_params = dict(snapshot)
+            results[name] = prompt.run(state=state,
+                                       info=info,
+                                       params=stage_params,
+                                       memory=memory,
+                                       provider=provider,
+                                       diverse_query=diverse_query,
+                                       exp_path=experiment_path,
+                                       save_dir=save_dir,
+                                       usage_tracker=usage_tracker)
+            return new_params(snapshot, stage_params)
+        return fn
+    
+    # plot kline chart, the prompt embeds the in-memory image and saving to disk happens in the background
+    def plot_kline_stage(snapshot):
+        kline_image = plots.render_kline(state=state,
+                                         info=info,
+                                         save_dir=save_dir,
+                                         mode=mode)
+        return {
+            "kline_image": kline_image,
+            "kline_path": kline_image.path if kline_image is not None else None,
+        }
+    
+    # Past latest market intelligence
+    def prepare_latest_market_intelligence_stage(snapshot):
+        prepared = prepare_latest_market_intelligence_params(state=state,
+                                                             info=info,
+                                                             params=snapshot,
+                                                             memory=memory,
+                                                             provider=provider,
+                                                             diverse_query=diverse_query,
+                                                             token_budget=cfg.get("past_market_intelligence_token_budget"),
+                                                             item_max_tokens=cfg.get("past_market_intelligence_item_max_tokens"))
+        return new_params(snapshot, prepared)
+    
+    # Save latest market intelligence to memory, once past market intelligence has been queried without it
+    def latest_market_intelligence_memory_stage(snapshot):
+        lmi_summary.add_to_memory(state=state,
+                                  info=info,
+                                  result=results["latest_market_intelligence_summary"],
+                                  memory=memory,
+                                  provider=embedding_provider)
+        return {}
+    
+    # Prepare past low level reflection params
+    def prepare_low_level_reflection_stage(snapshot):
+        prepared = prepare_low_level_reflection_params(state=state,
+                                                       info=info,
+                                                       params=snapshot,
+                                                       memory=memory,
+                                                       provider=provider,
+                                                       diverse_query=diverse_query)
+        return new_params(snapshot, prepared)
+    
+    # Store low level reflection in memory system, once past reflections have been queried without it
+    def low_level_reflection_memory_stage(snapshot):
+        low_level_reflection.add_to_memory(state=state,
+                                           info=info,
+                                           res=results["low_level_reflection"],
+                                           memory=memory,
+                                           provider=embedding_provider)
+        return {}
+    
+    # Each stage starts as soon as its inputs exist, independent stages overlap
+    stages = [
+        Stage("kline_chart", plot_kline_stage,
+              outputs=["kline_image", "kline_path"]),
+        Stage("latest_market_intelligence_summary", prompt_stage("latest_market_intelligence_summary", lmi_summary),
+              outputs=["asset_symbol", "latest_market_intelligence_query", "latest_market_intelligence_summary"]),
+        Stage("prepare_latest_market_intelligence", prepare_latest_market_intelligence_stage,
+              inputs=["asset_symbol", "latest_market_intelligence_query"],
+              outputs=["past_market_intelligence"]),
+        Stage("past_market_intelligence_summary", prompt_stage("past_market_intelligence_summary", pmi_summary),
+              inputs=["past_market_intelligence"],
+              outputs=["past_market_intelligence_summary"]),
+        Stage("latest_market_intelligence_memory", latest_market_intelligence_memory_stage,
+              inputs=["past_market_intelligence"]),
+        Stage("low_level_reflection", prompt_stage("low_level_reflection", low_level_reflection),
+              inputs=["kline_image", "latest_market_intelligence_summary", "past_market_intelligence_summary"],
+              outputs=["low_level_reflection_reasoning", "low_level_reflection_query"]),
+        Stage("prepare_low_level_reflection", prepare_low_level_reflection_stage,
+              inputs=["low_level_reflection_reasoning", "low_level_reflection_query"],
+              outputs=["latest_low_level_reflection", "past_low_level_reflection"]),
+        Stage("low_level_reflection_memory", low_level_reflection_memory_stage,
+              inputs=["past_low_level_reflection"]),
+        # Decision Making
+        Stage("decision", prompt_stage("decision", decision_prompt),
+              inputs=["latest_market_intelligence_summary", "past_market_intelligence_summary",
+                      "latest_low_level_reflection", "past_low_level_reflection",
+                      "trading_path", "trader_preference"],
+              outputs=["decision_action", "decision_reasoning"]),
+    ]
+    StageScheduler(stages, max_workers=cfg.get("stage_workers", 4)).run(params)
+    
+    kline_path = params["kline_path"]
+    decision_result = results["decision"]
 
     # add records
     trading_records["symbol"].append(info["symbol"])